@@ -0,0 +1,84 @@
+"""Benchmark calendar_store.py at hundreds of thousands of events per user.
+
+Bulk-imports a year of random events, then times day/week range queries
+against a linear scan of the same events, and a full cursor-paginated walk.
+
+    python bench_calendar_store.py [events]
+"""
+import random
+import statistics
+import sys
+import time
+
+from calendar_store import CalendarStore
+
+YEAR = 365 * 86400
+ORIGIN = 1_800_000_000
+
+
+def make_events(count):
+    rng = random.Random(42)
+    events = []
+    for i in range(count):
+        start = ORIGIN + rng.uniform(0, YEAR)
+        events.append({"start": start, "end": start + rng.choice([900, 1800, 3600, 7200, 14400]),
+                       "title": f"Event {i}"})
+    return events
+
+
+def timed(fn, runs):
+    """Median µs of fn() over runs"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.median(samples)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    events = make_events(count)
+    store = CalendarStore()
+
+    start = time.perf_counter()
+    store.bulk_import(events)
+    elapsed = time.perf_counter() - start
+    print(f"bulk import:   {count} events in {elapsed:.2f}s ({count / elapsed:.0f} events/sec)")
+
+    start = time.perf_counter()
+    for event in make_events(1000):
+        store.add(event)
+    print(f"single add:    {(time.perf_counter() - start) / 1000 * 1e6:.0f} µs each (with {len(store)} events)")
+
+    rng = random.Random(7)
+    spans = [(ORIGIN + rng.uniform(0, YEAR - 7 * 86400)) for _ in range(200)]
+    for label, width in (("day", 86400), ("week", 7 * 86400)):
+        hits = []
+
+        def indexed():
+            t = rng.choice(spans)
+            page, _ = store.query(t, t + width, 1000)
+            hits.append(len(page))
+
+        def scan():
+            t = rng.choice(spans)
+            return [e for e in events if e['start'] < t + width and e['end'] > t]
+
+        print(f"{label:5} query:   indexed {timed(indexed, 200):9.0f} µs   "
+              f"linear scan {timed(scan, 10):9.0f} µs   (~{statistics.mean(hits):.0f} events)")
+
+    start = time.perf_counter()
+    pages, total, cursor = 0, 0, None
+    while True:
+        page, cursor = store.query(ORIGIN, ORIGIN + YEAR, 1000, cursor)
+        pages += 1
+        total += len(page)
+        if cursor is None:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"paginated walk: {total} events in {pages} pages, {elapsed:.2f}s ({total / elapsed:.0f} events/sec)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Benchmark agent -> resource API calls: requests.get per call (the old
+view_calendar) against the pooled async client in http_client.py, and
+against the pooled client with ETag revalidation (response_cache.py).
+
+Runs offline: resource_api is served from a child process on a free port,
+with its token validator given a throwaway RSA key instead of the
+Keycloak JWKS. The stall column is what every other user of the agent
+sees while calendar calls are in flight; on a machine with few cores the
+calls/sec of both variants is bounded by the single resource API process.
+
+    python bench_resource_client.py [page_views] [concurrency]
+"""
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+import requests
+import uvicorn
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+PORT = free_port()
+os.environ['RESOURCE_API_URL'] = f"http://127.0.0.1:{PORT}"
+
+import http_client
+import resource_api
+from agent import render_events
+from response_cache import ResponseCache
+from bench_token_validation import make_realm, make_token
+from token_validator import TokenValidator
+
+
+async def loop_lag(stop):
+    """Worst delay of a 10 ms timer while the benchmark runs (event loop freezes)"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - start - 0.01)
+    return worst
+
+
+async def measure(label, view, page_views, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await view()
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    start = time.perf_counter()
+    await asyncio.gather(*[limited() for _ in range(page_views)])
+    elapsed = time.perf_counter() - start
+    stop.set()
+    print(f"{label:32} {page_views / elapsed:8.0f} calls/sec   "
+          f"worst event loop stall {await lag * 1000:7.1f} ms")
+
+
+def serve(discovery, jwks):
+    resource_api.token_validator = TokenValidator(discovery=discovery, jwks=jwks)
+    uvicorn.run(resource_api.api, host='127.0.0.1', port=PORT, log_level='warning')
+
+
+def wait_for_server():
+    for _ in range(200):
+        try:
+            socket.create_connection(('127.0.0.1', PORT), timeout=0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("resource API did not start")
+
+
+async def run(private_key, page_views, concurrency):
+    headers = {"Authorization": f"Bearer {make_token(private_key)}"}
+    url = f"http://127.0.0.1:{PORT}/api/calendar"
+
+    async def before():
+        # What view_calendar used to do: blocking call, new connection, no timeout
+        assert requests.get(url, headers=headers).status_code == 200
+
+    async def after():
+        assert (await http_client.resource_get("/api/calendar", headers=headers)).status_code == 200
+
+    cache = ResponseCache()
+
+    async def revalidated():
+        assert await cache.fetch('sarah', "/api/calendar", headers, render_events)
+
+    await after()  # warm up the server
+    await measure("requests.get per call (before)", before, page_views, concurrency)
+    await measure("pooled async client (after)", after, page_views, concurrency)
+    await measure("pooled + ETag revalidation", revalidated, page_views, concurrency)
+    print(f"Response cache: {cache.stats()}")
+    print(f"HTTP version: {(await http_client.resource_get('/api/calendar', headers=headers)).http_version}")
+    await http_client.close()
+
+
+async def breaker_demo():
+    """With the resource API down, calls fail fast once the circuit opens"""
+    for i in range(http_client.breaker.threshold + 3):
+        start = time.perf_counter()
+        try:
+            await http_client.resource_get("/api/calendar")
+            outcome = "ok"
+        except http_client.CircuitOpenError:
+            outcome = "refused (circuit open)"
+        except Exception as e:
+            outcome = type(e).__name__
+        print(f"  call {i + 1}: {outcome:24} {(time.perf_counter() - start) * 1000:6.2f} ms")
+    await http_client.close()
+
+
+def main():
+    page_views = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    private_key, discovery, jwks = make_realm()
+    server = multiprocessing.Process(target=serve, args=(discovery, jwks), daemon=True)
+    server.start()
+    wait_for_server()
+    try:
+        asyncio.run(run(private_key, page_views, concurrency))
+    finally:
+        server.terminate()
+        server.join()
+    print("Resource API stopped:")
+    asyncio.run(breaker_demo())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark local JWT validation in token_validator.py, with and without
+the claims cache.
+
+Runs offline: a throwaway RSA key stands in for the Keycloak realm key,
+and the validator is handed the matching discovery document and JWKS
+instead of fetching them.
+
+    python bench_token_validation.py [iterations]
+"""
+import asyncio
+import json
+import sys
+import time
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from config import KEYCLOAK_URL, REALM, TOKEN_AUDIENCE
+from claims_cache import ClaimsCache
+from token_validator import TokenValidator, TokenValidationError
+
+ISSUER = f"{KEYCLOAK_URL}/realms/{REALM}"
+
+
+def make_realm():
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': 'bench-key', 'alg': 'RS256', 'use': 'sig'})
+    discovery = {'issuer': ISSUER, 'jwks_uri': f"{ISSUER}/protocol/openid-connect/certs"}
+    return private_key, discovery, {'keys': [jwk]}
+
+
+def make_token(private_key, **claims):
+    now = int(time.time())
+    payload = {'iss': ISSUER, 'aud': TOKEN_AUDIENCE, 'sub': 'sarah', 'iat': now, 'exp': now + 300, **claims}
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': 'bench-key'})
+
+
+async def run(iterations):
+    private_key, discovery, jwks = make_realm()
+    # max_entries=0 disables the claims cache: every call verifies the signature
+    validator = TokenValidator(discovery=discovery, jwks=jwks, cache=ClaimsCache(max_entries=0))
+    token = make_token(private_key)
+
+    # Sanity: good token passes, tampered/expired/wrong-audience tokens don't
+    assert (await validator.validate(token))['sub'] == 'sarah'
+    for bad in (token[:-4] + 'AAAA', make_token(private_key, exp=int(time.time()) - 600),
+                make_token(private_key, aud='someone-else'), make_token(private_key, iss='https://evil')):
+        try:
+            await validator.validate(bad)
+            raise AssertionError("invalid token accepted")
+        except TokenValidationError:
+            pass
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await validator.validate(token)
+    elapsed = time.perf_counter() - start
+    uncached = elapsed / iterations
+    print(f"validate(), no claims cache:  {iterations / elapsed:10.0f} validations/sec "
+          f"({uncached * 1e6:.0f} µs each)")
+
+    # Same load spread over 200 users' tokens, with the claims cache
+    cached_validator = TokenValidator(discovery=discovery, jwks=jwks)
+    tokens = [make_token(private_key, sub=f"user-{i}") for i in range(200)]
+    start = time.perf_counter()
+    for i in range(iterations):
+        await cached_validator.validate(tokens[i % len(tokens)])
+    elapsed = time.perf_counter() - start
+    stats = cached_validator.cache.stats()
+    print(f"validate(), claims cache:     {iterations / elapsed:10.0f} validations/sec "
+          f"({elapsed / iterations * 1e6:.1f} µs each, hit rate {stats['hit_rate']:.1%})")
+    print(f"verification time saved:      {(uncached * iterations - elapsed) * 1000:10.0f} ms "
+          f"over {iterations} requests")
+
+    # Tokens with unknown kids: the JWKS was just loaded, so the re-fetch is
+    # rate limited away and these fail without touching the network
+    forged = jwt.encode({'sub': 'x'}, private_key, algorithm='RS256', headers={'kid': 'unknown'})
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            await validator.validate(forged)
+        except TokenValidationError:
+            pass
+    elapsed = time.perf_counter() - start
+    print(f"unknown kid rejected:         {iterations / elapsed:10.0f} tokens/sec "
+          f"({elapsed / iterations * 1e6:.0f} µs each)")
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
@@ -0,0 +1,172 @@
+import base64
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from config import CALENDAR_MAX_EVENT_DURATION
+
+
+class CalendarStore:
+    """One user's events, indexed for time-range queries.
+
+    Events are kept sorted by (start, id) in parallel lists. Because no
+    event lasts longer than max_duration (the longest stored so far, and
+    never more than CALENDAR_MAX_EVENT_DURATION), every event overlapping
+    [start, end) begins in [start - max_duration, end), and that window
+    is found with two binary searches. A range query therefore costs
+    O(log n) plus the events in the window. Pages resume after the
+    (start, id) of the last event returned, so cursors stay valid while
+    events are added.
+    """
+
+    def __init__(self):
+        self._keys = []
+        self._ends = []
+        self._events = []
+        self._next_id = 1
+        self.max_duration = 0.0
+        self.updated_at = time.time()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    @staticmethod
+    def _timestamp(value):
+        """Epoch seconds from a number, datetime or ISO 8601 string"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        if isinstance(value, datetime):
+            return value.timestamp()
+        raise ValueError(f"not a time: {value!r}")
+
+    def _make(self, event):
+        start = self._timestamp(event['start'])
+        end = self._timestamp(event['end'])
+        if not start < end:
+            raise ValueError("event must end after it starts")
+        if end - start > CALENDAR_MAX_EVENT_DURATION:
+            raise ValueError(f"event longer than {CALENDAR_MAX_EVENT_DURATION:.0f}s")
+        try:
+            begins, ends = datetime.fromtimestamp(start), datetime.fromtimestamp(end)
+        except (OverflowError, OSError) as e:
+            raise ValueError(f"time out of range: {e}")
+        event_id = self._next_id
+        self._next_id += 1
+        public = {
+            "id": event_id,
+            "time": begins.strftime('%I:%M %p').lstrip('0'),
+            "title": str(event['title']),
+            "start": begins.isoformat(),
+            "end": ends.isoformat(),
+        }
+        return (start, event_id), end, public
+
+    def add(self, event):
+        """Insert one event ({start, end, title}); returns its id"""
+        with self._lock:
+            key, end, public = self._make(event)
+            index = bisect_right(self._keys, key)
+            self._keys.insert(index, key)
+            self._ends.insert(index, end)
+            self._events.insert(index, public)
+            self.max_duration = max(self.max_duration, end - key[0])
+            self.updated_at = time.time()
+            return key[1]
+
+    def bulk_import(self, events):
+        """Insert many events with one sort instead of one insert each; returns the count
+
+        Either every event is valid and imported, or ValueError is raised
+        and nothing is.
+        """
+        with self._lock:
+            next_id = self._next_id
+            try:
+                rows = [self._make(event) for event in events]
+            except (KeyError, TypeError, ValueError) as e:
+                self._next_id = next_id
+                raise ValueError(f"invalid event: {e}")
+            count = len(rows)
+            if not count:
+                return 0
+            rows.extend(zip(self._keys, self._ends, self._events))
+            rows.sort(key=lambda row: row[0])
+            self._keys = [row[0] for row in rows]
+            self._ends = [row[1] for row in rows]
+            self._events = [row[2] for row in rows]
+            self.max_duration = max(self.max_duration, max(end - key[0] for key, end, _ in rows))
+            self.updated_at = time.time()
+            return count
+
+    def query(self, start, end, limit, cursor=None):
+        """(events overlapping [start, end) in start order, next_cursor or None)"""
+        start, end = self._timestamp(start), self._timestamp(end)
+        with self._lock:
+            lo = bisect_left(self._keys, (start - self.max_duration,))
+            if cursor is not None:
+                lo = max(lo, bisect_right(self._keys, decode_cursor(cursor)))
+            hi = bisect_left(self._keys, (end,))
+            page = []
+            for index in range(lo, hi):
+                if self._ends[index] > start:
+                    if len(page) == limit:
+                        # More to come: resume after the last event returned
+                        return page, encode_cursor(last_key)
+                    page.append(self._events[index])
+                    last_key = self._keys[index]
+            return page, None
+
+    def iter_range(self, start, end, page_size=1000):
+        """Every event overlapping [start, end), fetched a page at a time"""
+        cursor = None
+        while True:
+            page, cursor = self.query(start, end, page_size, cursor)
+            yield from page
+            if cursor is None:
+                return
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(f"{key[0]!r}:{key[1]}".encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(start, id) from a cursor; ValueError if it isn't one of ours"""
+    try:
+        start, event_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':')
+        return float(start), int(event_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid cursor: {e}")
+
+
+def _demo_events():
+    """The three sample events the calendar API has always shown, today"""
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return [
+        {"start": today + timedelta(hours=9), "end": today + timedelta(hours=9, minutes=15), "title": "Team Standup"},
+        {"start": today + timedelta(hours=14), "end": today + timedelta(hours=15), "title": "Client Meeting"},
+        {"start": today + timedelta(hours=16), "end": today + timedelta(hours=16, minutes=30), "title": "Code Review"},
+    ]
+
+
+class CalendarStores:
+    """Per-user CalendarStore registry; a new user starts with the demo events"""
+
+    def __init__(self):
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            store = self._stores.get(user_id)
+            if store is None:
+                store = self._stores[user_id] = CalendarStore()
+                store.bulk_import(_demo_events())
+            return store
+
+
+calendar_stores = CalendarStores()
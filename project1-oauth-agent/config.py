@@ -1,4 +1,5 @@
 import os
+import secrets
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,3 +15,50 @@ REDIRECT_URI = "http://localhost:3000/callback"
 AUTHORIZATION_ENDPOINT = f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/auth"
 TOKEN_ENDPOINT = f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/token"
 USERINFO_ENDPOINT = f"{KEYCLOAK_URL}/realms/{REALM}/protocol/openid-connect/userinfo"
+DISCOVERY_URL = f"{KEYCLOAK_URL}/realms/{REALM}/.well-known/openid-configuration"
+
+# Local token validation (token_validator.py)
+TOKEN_AUDIENCE = os.getenv('TOKEN_AUDIENCE', 'account')
+TOKEN_LEEWAY = int(os.getenv('TOKEN_LEEWAY', '30'))
+JWKS_CACHE_TTL = float(os.getenv('JWKS_CACHE_TTL', '3600'))
+JWKS_MIN_REFRESH_INTERVAL = float(os.getenv('JWKS_MIN_REFRESH_INTERVAL', '10'))
+CLAIMS_CACHE_SIZE = int(os.getenv('CLAIMS_CACHE_SIZE', '10000'))
+
+# Agent sessions (session_store.py); without SESSION_SECRET, cookies are
+# only valid until restart. SESSION_DB_FILE enables the SQLite backend.
+SESSION_SECRET = os.getenv('SESSION_SECRET') or secrets.token_hex(32)
+SESSION_COOKIE_NAME = os.getenv('SESSION_COOKIE_NAME', 'agent_session')
+SESSION_COOKIE_SECURE = os.getenv('SESSION_COOKIE_SECURE', 'false').lower() == 'true'
+SESSION_TTL = float(os.getenv('SESSION_TTL', '1800'))
+SESSION_MAX_ENTRIES = int(os.getenv('SESSION_MAX_ENTRIES', '10000'))
+SESSION_SHARDS = int(os.getenv('SESSION_SHARDS', '16'))
+SESSION_DB_FILE = os.getenv('SESSION_DB_FILE')
+
+# Shared async HTTP client (http_client.py)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', '20'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.2'))
+
+# Agent -> resource API client (http_client.resource_get); HTTP/2 needs h2 installed
+RESOURCE_API_URL = os.getenv('RESOURCE_API_URL', 'http://localhost:8000')
+RESOURCE_HTTP2 = os.getenv('RESOURCE_HTTP2', 'true').lower() == 'true'
+RESOURCE_MAX_CONNECTIONS = int(os.getenv('RESOURCE_MAX_CONNECTIONS', '50'))
+RESOURCE_MAX_KEEPALIVE = int(os.getenv('RESOURCE_MAX_KEEPALIVE', '20'))
+RESOURCE_TIMEOUT = float(os.getenv('RESOURCE_TIMEOUT', '5'))
+RESOURCE_CONNECT_TIMEOUT = float(os.getenv('RESOURCE_CONNECT_TIMEOUT', '2'))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', '30'))
+
+# Agent-side cache of resource API responses, revalidated with ETags (response_cache.py)
+RESPONSE_CACHE_SIZE = int(os.getenv('RESPONSE_CACHE_SIZE', '1000'))
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', '300'))
+
+# Calendar storage in resource_api (calendar_store.py)
+CALENDAR_PAGE_SIZE = int(os.getenv('CALENDAR_PAGE_SIZE', '100'))
+CALENDAR_MAX_PAGE_SIZE = int(os.getenv('CALENDAR_MAX_PAGE_SIZE', '1000'))
+# Longest allowed event; bounds how far back a range query has to look
+CALENDAR_MAX_EVENT_DURATION = float(os.getenv('CALENDAR_MAX_EVENT_DURATION', str(7 * 86400)))
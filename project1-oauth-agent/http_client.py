@@ -0,0 +1,208 @@
+import asyncio
+import random
+import time
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+except ImportError:
+    h2 = None
+
+from config import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_MAX_PER_HOST,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+    RESOURCE_API_URL,
+    RESOURCE_HTTP2,
+    RESOURCE_MAX_CONNECTIONS,
+    RESOURCE_MAX_KEEPALIVE,
+    RESOURCE_TIMEOUT,
+    RESOURCE_CONNECT_TIMEOUT,
+    BREAKER_FAILURE_THRESHOLD,
+    BREAKER_RESET_TIMEOUT,
+)
+
+# Safe to resend: the server answered but asked us to come back later
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+# One pooled client per event loop, with a concurrency cap per host
+_client = None
+_loop = None
+_hosts = {}
+
+
+def get_client():
+    """Shared keep-alive httpx.AsyncClient for the running event loop"""
+    global _client, _loop, _hosts
+    loop = asyncio.get_running_loop()
+    if _client is None or _loop is not loop:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        )
+        _loop = loop
+        _hosts = {}
+    return _client
+
+
+def _host_limit(url):
+    host = httpx.URL(url).host
+    if host not in _hosts:
+        _hosts[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+    return _hosts[host]
+
+
+def _delay(attempt, response=None):
+    retry_after = response.headers.get('Retry-After') if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), HTTP_BACKOFF * 2 ** HTTP_RETRIES)
+    return HTTP_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.0)
+
+
+async def request(method, url, retry_unsafe=False, **kwargs):
+    """Send a request through the shared pool, retrying with jittered backoff
+
+    Connection failures are retried for any method (nothing was sent);
+    timeouts and 429/502/503/504 only for idempotent methods unless
+    retry_unsafe is set.
+    """
+    client = get_client()
+    retry_sent = retry_unsafe or method.upper() in IDEMPOTENT_METHODS
+    attempt = 0
+    while True:
+        response = None
+        try:
+            async with _host_limit(url):
+                response = await client.request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUSES or not retry_sent or attempt >= HTTP_RETRIES:
+                return response
+        except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout):
+            if attempt >= HTTP_RETRIES:
+                raise
+        except httpx.TransportError:
+            if not retry_sent or attempt >= HTTP_RETRIES:
+                raise
+        await asyncio.sleep(_delay(attempt, response))
+        attempt += 1
+
+
+async def get(url, **kwargs):
+    return await request('GET', url, **kwargs)
+
+
+async def post(url, **kwargs):
+    return await request('POST', url, **kwargs)
+
+
+class CircuitOpenError(Exception):
+    """The resource API failed repeatedly; calls are refused until it cools down"""
+
+
+class CircuitBreaker:
+    """Stops calling a failing service so requests fail fast instead of piling up.
+
+    After `threshold` consecutive failures the circuit opens and every call
+    is refused for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self):
+        state = self.state
+        if state == 'open' or (state == 'half-open' and self._trial):
+            raise CircuitOpenError(f"resource API circuit open after {self.failures} failures")
+        if state == 'half-open':
+            self._trial = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def abandon(self):
+        """A call ended without a verdict (e.g. it was cancelled)"""
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial = False
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+# Agent -> resource API traffic has its own pool, timeouts and breaker,
+# so a slow resource API can't starve the identity provider calls
+_resource_client = None
+_resource_loop = None
+breaker = CircuitBreaker()
+
+
+def get_resource_client():
+    """Shared keep-alive client for the resource API (HTTP/2 when h2 is installed)"""
+    global _resource_client, _resource_loop
+    loop = asyncio.get_running_loop()
+    if _resource_client is None or _resource_loop is not loop:
+        _resource_client = httpx.AsyncClient(
+            base_url=RESOURCE_API_URL,
+            http2=RESOURCE_HTTP2 and h2 is not None,
+            limits=httpx.Limits(max_connections=RESOURCE_MAX_CONNECTIONS,
+                                max_keepalive_connections=RESOURCE_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(RESOURCE_TIMEOUT, connect=RESOURCE_CONNECT_TIMEOUT),
+        )
+        _resource_loop = loop
+    return _resource_client
+
+
+async def resource_get(path, **kwargs):
+    """GET a resource API path through the breaker
+
+    Raises CircuitOpenError while the circuit is open. Transport errors,
+    timeouts and 5xx responses count as failures.
+    """
+    breaker.before_call()
+    try:
+        response = await get_resource_client().get(path, **kwargs)
+    except httpx.TransportError:
+        breaker.record_failure()
+        raise
+    except BaseException:
+        breaker.abandon()
+        raise
+    if response.status_code >= 500:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return response
+
+
+async def close():
+    global _client, _loop, _resource_client, _resource_loop
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+        _loop = None
+    if _resource_client is not None:
+        await _resource_client.aclose()
+        _resource_client = None
+        _resource_loop = None
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+
+import http_client
+from config import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+
+
+class ResponseCache:
+    """Per-user cache of resource API responses, revalidated with ETags.
+
+    Each entry keeps the validators (ETag, Last-Modified) of the last 200
+    response for a (user, path) pair together with what the agent rendered
+    from it. Every view still asks the resource API, but conditionally: a
+    304 reuses the rendered page, so an unchanged calendar costs an empty
+    round trip instead of a full payload and a re-render. Entries older
+    than RESPONSE_CACHE_TTL seconds are dropped, and beyond
+    RESPONSE_CACHE_SIZE the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.revalidated = 0
+        self.fetched = 0
+        self.evictions = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry['stored_at'] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, response, rendered):
+        entry = {
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+            'rendered': rendered,
+            'stored_at': time.monotonic(),
+        }
+        if entry['etag'] is None and entry['last_modified'] is None:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    async def fetch(self, user_key, path, headers, render):
+        """render(response) for path, reusing the cached render on a 304
+
+        Only a 200 is rendered; any other status raises httpx.HTTPStatusError
+        so the caller can tell an expired token from a broken API.
+        """
+        key = (user_key, path)
+        entry = self._get(key)
+        headers = dict(headers)
+        if entry is not None:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = await http_client.resource_get(path, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            # Unchanged: reuse the render and restart its TTL
+            with self._lock:
+                entry['stored_at'] = time.monotonic()
+            return entry['rendered']
+        if response.status_code != 200:
+            raise httpx.HTTPStatusError(f"Resource API returned {response.status_code} for {path}",
+                                        request=response.request, response=response)
+        rendered = render(response)
+        self.fetched += 1
+        self._put(key, response, rendered)
+        return rendered
+
+    def invalidate(self, user_key):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == user_key]:
+                del self._entries[key]
+
+    def stats(self):
+        views = self.revalidated + self.fetched
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "revalidated": self.revalidated,
+            "fetched": self.fetched,
+            "evictions": self.evictions,
+            "revalidated_rate": round(self.revalidated / views, 4) if views else 0.0,
+        }
+
+
+response_cache = ResponseCache()
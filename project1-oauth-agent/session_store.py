@@ -0,0 +1,215 @@
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import (
+    SESSION_SECRET,
+    SESSION_COOKIE_NAME,
+    SESSION_COOKIE_SECURE,
+    SESSION_TTL,
+    SESSION_MAX_ENTRIES,
+    SESSION_SHARDS,
+    SESSION_DB_FILE,
+)
+
+
+class Session(dict):
+    """One browser session's data (PKCE verifier, tokens, claims)"""
+
+    def __init__(self, sid, data=None, new=False):
+        super().__init__(data or {})
+        self.sid = sid
+        self.new = new
+
+
+class SQLiteSessionBackend:
+    """Durable session backend, so sessions survive an agent restart"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def load(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires_at > ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, sid, data, expires_at):
+        self._conn().execute(
+            "INSERT INTO sessions (sid, data, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (sid) DO UPDATE SET data = excluded.data, expires_at = excluded.expires_at",
+            (sid, json.dumps(data), expires_at)
+        )
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def sweep(self):
+        self._conn().execute("DELETE FROM sessions WHERE expires_at <= ?", (time.time(),))
+
+
+class SessionStore:
+    """Server-side sessions behind HMAC-signed session cookies.
+
+    The cookie carries only a random session id and its signature; the
+    data lives in memory, split into SESSION_SHARDS shards with a lock
+    each, so concurrent requests rarely contend. Each shard is an LRU
+    ordered by last access, and since every access also extends the
+    session by SESSION_TTL seconds, expired sessions collect at the front
+    and are swept from there; past SESSION_MAX_ENTRIES the least recently
+    used sessions are evicted. An optional backend (anything with
+    load/save/delete, e.g. SQLiteSessionBackend) is written through on
+    save and consulted on a memory miss.
+    """
+
+    def __init__(self, secret=SESSION_SECRET, ttl=SESSION_TTL, max_entries=SESSION_MAX_ENTRIES,
+                 shards=SESSION_SHARDS, backend=None):
+        self._secret = secret.encode()
+        self.ttl = ttl
+        self._shard_size = max(1, max_entries // shards)
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+        self.backend = backend
+        self.created = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def _shard(self, sid):
+        return self._shards[int.from_bytes(hashlib.blake2b(sid.encode(), digest_size=4).digest(), 'big')
+                            % len(self._shards)]
+
+    def _signature(self, sid):
+        digest = hmac.new(self._secret, sid.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+    def sign(self, sid):
+        return f"{sid}.{self._signature(sid)}"
+
+    def unsign(self, cookie):
+        """Session id from a cookie value, or None if the signature doesn't match"""
+        sid, _, signature = (cookie or '').rpartition('.')
+        if not sid or not hmac.compare_digest(signature, self._signature(sid)):
+            return None
+        return sid
+
+    def _put(self, session, now):
+        entries, lock = self._shard(session.sid)
+        with lock:
+            entries[session.sid] = (session, now + self.ttl)
+            entries.move_to_end(session.sid)
+            # Oldest access first, so expired entries are at the front
+            while entries:
+                sid, (_, expires_at) = next(iter(entries.items()))
+                if expires_at > now and len(entries) <= self._shard_size:
+                    break
+                entries.popitem(last=False)
+                if expires_at > now:
+                    self.evictions += 1
+                else:
+                    self.expired += 1
+
+    def get(self, sid):
+        """Live session for sid (extending its TTL), or None"""
+        now = time.time()
+        entries, lock = self._shard(sid)
+        with lock:
+            entry = entries.get(sid)
+            if entry is not None:
+                session, expires_at = entry
+                if expires_at > now:
+                    entries[sid] = (session, now + self.ttl)
+                    entries.move_to_end(sid)
+                    return session
+                del entries[sid]
+                self.expired += 1
+        if self.backend is not None:
+            data = self.backend.load(sid)
+            if data is not None:
+                session = Session(sid, data)
+                self._put(session, now)
+                return session
+        return None
+
+    def save(self, session):
+        """Store a new session, or persist changes to the backend if there is one"""
+        if session.new:
+            session.new = False
+            self._put(session, time.time())
+            self.created += 1
+            if self.backend is not None and self.created % 1000 == 0:
+                self.backend.sweep()
+        if self.backend is not None:
+            self.backend.save(session.sid, dict(session), time.time() + self.ttl)
+
+    def delete(self, sid):
+        entries, lock = self._shard(sid)
+        with lock:
+            entries.pop(sid, None)
+        if self.backend is not None:
+            self.backend.delete(sid)
+
+    def from_request(self, request):
+        """The request's session, or a new empty one if it has no valid session cookie
+
+        A new session is only stored once it is saved (see attach).
+        """
+        sid = self.unsign(request.cookies.get(SESSION_COOKIE_NAME))
+        session = self.get(sid) if sid else None
+        return session if session is not None else Session(secrets.token_urlsafe(32), new=True)
+
+    def attach(self, response, session):
+        """Save session and set its signed cookie on response"""
+        self.save(session)
+        response.set_cookie(SESSION_COOKIE_NAME, self.sign(session.sid), max_age=int(self.ttl),
+                            httponly=True, secure=SESSION_COOKIE_SECURE, samesite='lax')
+        return response
+
+    def refresh(self, response, session):
+        """Re-send an existing session's cookie, whose expiry get() just extended
+
+        Without this the cookie's max_age runs out while the session is still
+        in use. A new, unsaved session is left alone.
+        """
+        if not session.new:
+            self.attach(response, session)
+        return response
+
+    def rotate(self, session):
+        """The session's data under a fresh id, with the old id deleted
+
+        Call it when the session gains privileges (login), so a session id
+        planted in the browser beforehand is worthless afterwards.
+        """
+        if not session.new:
+            self.delete(session.sid)
+        return Session(secrets.token_urlsafe(32), session, new=True)
+
+    def stats(self):
+        return {
+            "sessions": sum(len(entries) for entries, _ in self._shards),
+            "created": self.created,
+            "expired": self.expired,
+            "evictions": self.evictions,
+        }
+
+
+session_store = SessionStore(backend=SQLiteSessionBackend(SESSION_DB_FILE) if SESSION_DB_FILE else None)
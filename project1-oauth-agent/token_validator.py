@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import jwt
+
+import http_client
+from claims_cache import ClaimsCache
+from config import (
+    DISCOVERY_URL,
+    TOKEN_AUDIENCE,
+    TOKEN_LEEWAY,
+    JWKS_CACHE_TTL,
+    JWKS_MIN_REFRESH_INTERVAL,
+)
+
+# Asymmetric algorithms only: never "none", and never HS* with a public key
+ALLOWED_ALGORITHMS = ['RS256', 'RS384', 'RS512', 'PS256', 'PS384', 'PS512', 'ES256', 'ES384', 'ES512']
+
+
+class TokenValidationError(Exception):
+    """The bearer token is malformed, badly signed, expired or not meant for us"""
+
+
+class TokenValidator:
+    """Validates Keycloak-issued JWTs locally.
+
+    The realm's OIDC discovery document and JWKS are fetched once and
+    cached for JWKS_CACHE_TTL seconds. A token signed with an unknown kid
+    triggers one JWKS re-fetch (key rotation), at most every
+    JWKS_MIN_REFRESH_INTERVAL seconds, so random kids can't hammer the
+    IdP. Signature, exp, aud and iss are then checked without any network
+    call, and the claims of a valid token are cached until its exp, so
+    repeated requests with the same token skip verification entirely.
+    """
+
+    def __init__(self, discovery_url=DISCOVERY_URL, audience=TOKEN_AUDIENCE,
+                 discovery=None, jwks=None, cache=None):
+        self.discovery_url = discovery_url
+        self.audience = audience
+        self.cache = cache if cache is not None else ClaimsCache()
+        self._discovery = discovery
+        self._keys = self._parse_jwks(jwks) if jwks else None
+        self._fetched_at = time.monotonic() if jwks else 0.0
+        self._lock = None
+
+    @staticmethod
+    def _parse_jwks(jwks):
+        keys = {}
+        for data in jwks.get('keys', []):
+            if data.get('use', 'sig') != 'sig' or data.get('alg', 'RS256') not in ALLOWED_ALGORITHMS:
+                continue
+            try:
+                keys[data.get('kid')] = jwt.PyJWK(data)
+            except jwt.PyJWTError:
+                continue
+        return keys
+
+    async def _refresh_keys(self, force=False):
+        """Fetch discovery + JWKS if stale (or forced by an unknown kid); coalesced"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if self._keys is not None and age < (JWKS_MIN_REFRESH_INTERVAL if force else JWKS_CACHE_TTL):
+                return
+            if self._discovery is None or not force:
+                response = await http_client.get(self.discovery_url)
+                response.raise_for_status()
+                self._discovery = response.json()
+            response = await http_client.get(self._discovery['jwks_uri'])
+            response.raise_for_status()
+            self._keys = self._parse_jwks(response.json())
+            self._fetched_at = time.monotonic()
+
+    async def _key_for(self, kid):
+        if self._keys is None or time.monotonic() - self._fetched_at >= JWKS_CACHE_TTL:
+            await self._refresh_keys()
+        if kid not in self._keys:
+            # Possibly a rotated key: re-fetch once, rate limited
+            await self._refresh_keys(force=True)
+        key = self._keys.get(kid)
+        if key is None:
+            raise TokenValidationError(f"Unknown signing key: {kid}")
+        return key
+
+    async def validate(self, token, audience=None):
+        """Return the verified claims of token, or raise TokenValidationError"""
+        # Cached claims were verified against the default audience only
+        if audience is None:
+            claims = self.cache.get(token)
+            if claims is not None:
+                return claims
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise TokenValidationError(f"Malformed token: {e}")
+        if header.get('alg') not in ALLOWED_ALGORITHMS:
+            raise TokenValidationError(f"Algorithm not allowed: {header.get('alg')}")
+        try:
+            key = await self._key_for(header.get('kid'))
+        except TokenValidationError:
+            raise
+        except Exception as e:
+            raise TokenValidationError(f"Signing keys unavailable: {e}")
+        try:
+            claims = jwt.decode(
+                token,
+                key.key,
+                algorithms=[header['alg']],
+                audience=audience or self.audience,
+                issuer=self._discovery['issuer'],
+                leeway=TOKEN_LEEWAY,
+                options={'require': ['exp', 'iat', 'iss']},
+            )
+        except jwt.PyJWTError as e:
+            raise TokenValidationError(str(e))
+        if audience is None:
+            self.cache.put(token, claims)
+        return claims
+
+
+token_validator = TokenValidator()
@@ -1,15 +1,19 @@
 import secrets
 import hashlib
 import base64
+import html
 
 from config import AUTHORIZATION_ENDPOINT, CLIENT_ID, REDIRECT_URI
 import urllib.parse
 
-import requests
 from config import TOKEN_ENDPOINT
+import httpx
+import http_client
+from session_store import session_store
+from response_cache import response_cache
 
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, RedirectResponse
 import uvicorn
 
 import jwt 
@@ -43,8 +47,12 @@ def build_authorization_url(code_challenge):
 
 
 
-def exchange_code_for_token(code, code_verifier):
-    """Exchange authorization code for access token using PKCE verifier"""
+async def exchange_code_for_token(code, code_verifier):
+    """Exchange authorization code for access token using PKCE verifier
+
+    Raises httpx.HTTPStatusError for an error response and ValueError when
+    the response is not JSON or lacks the tokens.
+    """
     data = {
         'grant_type': 'authorization_code',
         'code': code,
@@ -52,89 +60,140 @@ def exchange_code_for_token(code, code_verifier):
         'client_id': CLIENT_ID,
         'code_verifier': code_verifier
     }
-    response = requests.post(TOKEN_ENDPOINT, data=data)
-    return response.json()
+    response = await http_client.post(TOKEN_ENDPOINT, data=data)
+    # An error response (e.g. invalid_grant for a reused code) carries no tokens
+    response.raise_for_status()
+    token_response = response.json()
+    if not token_response.get('access_token') or not token_response.get('id_token'):
+        raise ValueError("token response has no access_token and id_token")
+    return token_response
 
 def decode_id_token(id_token):
-    """Decode ID token to extract user claims (without verification for demo)"""
+    """Decode ID token to extract user claims (without verification for demo)
+
+    Decoded once at login and kept in the session; these claims are
+    unverified, so they stay out of the verified-only ClaimsCache.
+    """
     # In production, you should verify the signature
-    decoded = jwt.decode(id_token, options={"verify_signature": False})
-    return decoded
+    return jwt.decode(id_token, options={"verify_signature": False})
+
+
+def render_events(response):
+    """Calendar API response as HTML lines (event text is user-supplied, so escaped)"""
+    events = response.json().get("events", [])
+    return "<br>".join([f"{html.escape(str(e['time']))}: {html.escape(str(e['title']))}" for e in events])
 
 
 app = FastAPI()
 
-# Store these temporarily (in production, use proper session management)
-pkce_verifier = None
-access_token = None
-id_token = None
+@app.on_event("shutdown")
+async def shutdown():
+    await http_client.close()
+
+# PKCE verifier, tokens and ID token claims are kept per browser session (session_store.py)
 
 @app.get("/")
-async def home():
+async def home(request: Request):
     """Start the OAuth flow"""
-    global pkce_verifier
+    session = session_store.from_request(request)
     
     # Generate PKCE pair
-    pkce_verifier, code_challenge = generate_pkce_pair()
+    session['pkce_verifier'], code_challenge = generate_pkce_pair()
     
     # Build authorization URL
     auth_url = build_authorization_url(code_challenge)
     
-    return HTMLResponse(f"""
+    return session_store.attach(HTMLResponse(f"""
         <h1>AI Agent OAuth Demo</h1>
         <p>Click below to authorize the agent:</p>
         <a href="{auth_url}">Authorize Agent</a>
-    """)
+    """), session)
 
 @app.get("/callback")
-async def callback(code: str):
+async def callback(request: Request, code: str):
     """Handle OAuth callback with authorization code"""
-    global pkce_verifier, access_token, id_token
+    session = session_store.from_request(request)
+    pkce_verifier = session.pop('pkce_verifier', None)
+    if not pkce_verifier:
+        return HTMLResponse("<h1>Error: Session expired, please <a href='/'>start again</a></h1>")
     
-    # Exchange code for token
-    token_response = exchange_code_for_token(code, pkce_verifier)
+    # Exchange code for token, before touching the session it would replace
+    try:
+        token_response = await exchange_code_for_token(code, pkce_verifier)
+    except httpx.HTTPStatusError as e:
+        return HTMLResponse(f"<h1>Login failed: token endpoint returned HTTP {e.response.status_code}</h1>"
+                            "<a href='/'>Start again</a>", status_code=502)
+    except httpx.HTTPError as e:
+        return HTMLResponse(f"<h1>Login failed: {type(e).__name__}</h1><a href='/'>Start again</a>", status_code=502)
+    except ValueError:
+        return HTMLResponse("<h1>Login failed: invalid token response</h1><a href='/'>Start again</a>", status_code=502)
     access_token = token_response.get('access_token')
     id_token = token_response.get('id_token')
 
-
-    claims = decode_id_token(id_token=id_token)
+    try:
+        claims = decode_id_token(id_token=id_token)
+    except jwt.InvalidTokenError:
+        return HTMLResponse("<h1>Login failed: invalid ID token</h1><a href='/'>Start again</a>", status_code=502)
+    # New login: don't serve responses cached under the previous one
+    response_cache.invalidate(session.sid)
+    # and don't keep a session id that existed before it (session fixation)
+    session = session_store.rotate(session)
+    session.update(access_token=access_token, id_token=id_token, claims=claims)
     user_name = claims.get('name', 'User')
     user_email = claims.get('email', 'no-email')
     log_action(user_email, user_name, "authorized_agent", "ai-agent-client")
     
-    return HTMLResponse(f"""
+    return session_store.attach(HTMLResponse(f"""
         <h1>Authorization Successful!</h1>
         <p>Access token received (first 20 chars): {access_token[:20]}...</p>
         <p>ID token generated (first 20 chars): {id_token[:20]}...</p>
         <a href="/calendar">View Calendar</a>
-    """)
+    """), session)
 
 
 @app.get("/calendar")
-async def view_calendar():
+async def view_calendar(request: Request):
     """Agent calls the calendar API on behalf of user"""
-    global access_token
-    global id_token 
+    session = session_store.from_request(request)
+    # Reading the session extended it, so extend its cookie too
+    return session_store.refresh(await calendar_page(session), session)
+
+
+async def calendar_page(session):
+    """The calendar view for a session"""
+    access_token = session.get('access_token')
     
     if not access_token:
         return HTMLResponse("<h1>Error: Not authorized yet</h1>")
     
-    if not id_token:
+    if not session.get('id_token'):
         return HTMLResponse("<h1>Error: Not authenticated yet</h1>")
     
-    claims = decode_id_token(id_token=id_token)
+    claims = session['claims']
     user_name = claims.get('name', 'User')
     user_email = claims.get('email', 'no-email')
     
     # Call the resource API with the access token
     headers = {"Authorization": f"Bearer {access_token}"}
     log_action(user_email, user_name, "accessed_calendar", "ai-agent-client")
-    response = requests.get("http://localhost:8000/api/calendar", headers=headers)
-    
-    events = response.json().get("events", [])
-    events_html = "<br>".join([f"{e['time']}: {e['title']}" for e in events])
-
-    
+    try:
+        # Conditional request: an unchanged calendar comes back as an empty 304
+        events_html = await response_cache.fetch(session.sid, "/api/calendar", headers, render_events)
+    except http_client.CircuitOpenError:
+        return HTMLResponse("<h1>Calendar is temporarily unavailable, try again shortly</h1>", status_code=503)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401:
+            # Token expired or revoked: drop the tokens and log in again
+            for key in ('access_token', 'id_token', 'claims'):
+                session.pop(key, None)
+            response_cache.invalidate(session.sid)
+            return RedirectResponse("/")
+        return HTMLResponse(f"<h1>Calendar API error: HTTP {e.response.status_code}</h1>", status_code=502)
+    except httpx.HTTPError as e:
+        return HTMLResponse(f"<h1>Calendar API error: {type(e).__name__}</h1>", status_code=502)
+    except ValueError:
+        # Not the JSON the calendar API promises
+        return HTMLResponse("<h1>Calendar API error: invalid response</h1>", status_code=502)
     
     return HTMLResponse(f"""
         <h1>Hi {user_name}!, here are your Calendar</h1>
@@ -142,54 +201,61 @@ async def view_calendar():
     """)
 
 @app.get("/token-info")
-async def token_info():
+async def token_info(request: Request):
     """Display decoded ID token claims"""
-    global id_token
+    session = session_store.from_request(request)
     
-    if not id_token:
-        return HTMLResponse("<h1>Error: No ID token available</h1>")
+    if not session.get('id_token'):
+        return session_store.refresh(HTMLResponse("<h1>Error: No ID token available</h1>"), session)
     
-    # Decode the ID token
-    claims = decode_id_token(id_token)
+    # Decoded at login
+    claims = session['claims']
     
     # Format claims as HTML
     claims_html = "<br>".join([f"<strong>{key}:</strong> {value}" for key, value in claims.items()])
     
-    return HTMLResponse(f"""
+    return session_store.refresh(HTMLResponse(f"""
         <h1>ID Token Claims</h1>
         {claims_html}
         <br><br>
         <a href="/calendar">View Calendar</a>
-    """)
+    """), session)
 
 
 @app.get("/compare-tokens")
-async def compare_tokens():
+async def compare_tokens(request: Request):
     """Compare access_token and id_token side by side"""
-    global access_token, id_token
+    session = session_store.from_request(request)
+    access_token = session.get('access_token')
+    id_token = session.get('id_token')
     
     if not access_token or not id_token:
-        return HTMLResponse("<h1>Error: Tokens not available</h1>")
+        return session_store.refresh(HTMLResponse("<h1>Error: Tokens not available</h1>"), session)
     
-    # Decode both tokens
-    access_claims = decode_id_token(access_token)
-    id_claims = decode_id_token(id_token)
+    # Decode both tokens (the access token for display only, unverified)
+    try:
+        access_claims = decode_id_token(access_token)
+    except jwt.InvalidTokenError:
+        access_claims = {"error": "access token is not a JWT"}
+    id_claims = session['claims']
     
-    return HTMLResponse(f"""
+    return session_store.refresh(HTMLResponse(f"""
         <h1>Token Comparison</h1>
         <div style="display: flex; gap: 20px;">
             <div style="flex: 1;">
                 <h2>Access Token (OAuth)</h2>
                 <p><em>Purpose: Authorization - What you can DO</em></p>
+                <p><small>Decoded without signature verification</small></p>
                 <pre>{json.dumps(access_claims, indent=2)}</pre>
             </div>
             <div style="flex: 1;">
                 <h2>ID Token (OIDC)</h2>
                 <p><em>Purpose: Authentication - Who you ARE</em></p>
+                <p><small>Decoded without signature verification</small></p>
                 <pre>{json.dumps(id_claims, indent=2)}</pre>
             </div>
         </div>
-    """)
+    """), session)
 
 
 if __name__ == "__main__":
@@ -1,11 +1,77 @@
+import hashlib
+import os
+import sys
 from datetime import datetime
 
+AUDIT_FILE = 'audit.log'
+GENESIS_HASH = "0" * 64
+HASH_MARKER = " | hash="
+
+# Hash of the last line written, read from the file on first use
+_last_hash = None
+
+
+def _line_hash(prev_hash, log_entry):
+    return hashlib.sha256((prev_hash + log_entry).encode()).hexdigest()
+
+
+def _read_last_hash():
+    """Hash of the last chained line in the file (lines from before chaining have none)"""
+    if not os.path.exists(AUDIT_FILE):
+        return GENESIS_HASH
+    with open(AUDIT_FILE, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 4096))
+        lines = f.read().decode(errors='replace').splitlines()
+    if lines and HASH_MARKER in lines[-1]:
+        return lines[-1].rsplit(HASH_MARKER, 1)[1]
+    return GENESIS_HASH
+
+
 def log_action(user_email, user_name, action, agent_client):
-    """Log user actions with identity information"""
+    """Log user actions with identity information
+
+    Each line ends with hash=sha256(previous hash + line), so editing or
+    deleting any earlier line breaks the chain (see verify_log).
+    """
+    global _last_hash
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     log_entry = f"[{timestamp}] User: {user_email} ({user_name}) | Action: {action} | Agent: {agent_client}"
     print(log_entry)
-    
+
+    if _last_hash is None:
+        _last_hash = _read_last_hash()
+    _last_hash = _line_hash(_last_hash, log_entry)
+
     # In production, write to file or send to logging service
-    with open('audit.log', 'a') as f:
-        f.write(log_entry + '\n')
\ No newline at end of file
+    with open(AUDIT_FILE, 'a') as f:
+        f.write(log_entry + HASH_MARKER + _last_hash + '\n')
+
+
+def verify_log(path=AUDIT_FILE):
+    """Check the hash chain; returns (True, None) or (False, first bad line number)
+
+    Unchained lines are only accepted before the first chained one (written
+    before the chain existed); after that, a line without a hash is tampering.
+    """
+    prev_hash = GENESIS_HASH
+    chained = False
+    with open(path, 'r') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if HASH_MARKER not in line:
+                if chained:
+                    return False, line_no
+                continue
+            chained = True
+            log_entry, line_hash = line.rsplit(HASH_MARKER, 1)
+            if _line_hash(prev_hash, log_entry) != line_hash:
+                return False, line_no
+            prev_hash = line_hash
+    return True, None
+
+
+if __name__ == '__main__':
+    ok, line_no = verify_log(sys.argv[1] if len(sys.argv) > 1 else AUDIT_FILE)
+    print("Audit log chain OK" if ok else f"Audit log chain broken at line {line_no}")
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,98 @@
+"""Load test for per-user sessions: many concurrent browsers, no cross-talk.
+
+Runs offline against the agent app in-process. Each simulated user
+starts the OAuth flow with its own cookie jar; the PKCE verifier stored
+in that user's session must hash to the code_challenge in the
+authorization URL that user was given. A second pass hammers the session
+store from many threads, each checking it only ever sees its own data.
+
+    python load_test_sessions.py [users]
+"""
+import asyncio
+import base64
+import hashlib
+import sys
+import threading
+import time
+import urllib.parse
+
+import httpx
+
+from agent import app
+from config import SESSION_COOKIE_NAME
+from session_store import SessionStore, Session, session_store
+
+
+def challenge_for(verifier):
+    return base64.urlsafe_b64encode(hashlib.sha256(verifier.encode()).digest()).decode().rstrip('=')
+
+
+async def browser(client_factory, results):
+    async with client_factory() as client:
+        for _ in range(2):
+            response = await client.get('/')
+            href = response.text.split('href="', 1)[1].split('"', 1)[0]
+            challenge = urllib.parse.parse_qs(urllib.parse.urlsplit(href).query)['code_challenge'][0]
+            sid = session_store.unsign(client.cookies[SESSION_COOKIE_NAME])
+            session = session_store.get(sid)
+            results.append(sid is not None and session is not None
+                           and challenge_for(session['pkce_verifier']) == challenge)
+
+
+async def run_app(users):
+    transport = httpx.ASGITransport(app=app)
+
+    def client_factory():
+        return httpx.AsyncClient(transport=transport, base_url='http://agent')
+
+    results = []
+    start = time.perf_counter()
+    await asyncio.gather(*[browser(client_factory, results) for _ in range(users)])
+    elapsed = time.perf_counter() - start
+    print(f"{users} concurrent browsers, {len(results)} requests in {elapsed:.2f}s "
+          f"({len(results) / elapsed:.0f} req/s)")
+    print(f"  sessions matching their own PKCE challenge: {sum(results)}/{len(results)}")
+    print(f"  session store: {session_store.stats()}")
+    assert all(results), "cross-talk between sessions"
+
+    # A forged or tampered cookie must not resolve to anyone's session
+    sid = next(iter(session_store._shards[0][0]), None) or 'x'
+    assert session_store.unsign(sid + '.forged') is None
+    async with client_factory() as client:
+        client.cookies.set(SESSION_COOKIE_NAME, sid + '.forged')
+        response = await client.get('/calendar')
+        assert 'Not authorized' in response.text
+
+
+def run_threads(threads, ops):
+    store = SessionStore(max_entries=threads * ops)
+    errors = []
+
+    def worker(n):
+        mine = []
+        for i in range(ops):
+            session = Session(f"t{n}-{i}", new=True)
+            session['owner'] = n
+            store.save(session)
+            mine.append(session.sid)
+        for sid in mine:
+            session = store.get(sid)
+            if session is None or session['owner'] != n:
+                errors.append(sid)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    print(f"{threads} threads x {ops} sessions: {threads * ops * 2 / elapsed:.0f} ops/s, "
+          f"{len(errors)} wrong or missing")
+    assert not errors, "cross-talk between sessions"
+
+
+if __name__ == '__main__':
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    asyncio.run(run_app(users))
+    run_threads(32, max(1, users // 4))
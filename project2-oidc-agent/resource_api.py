@@ -1,26 +1,131 @@
-from fastapi import FastAPI, Header, HTTPException
-from typing import Optional
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Query, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from datetime import datetime, timedelta
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional
+import asyncio
+import hashlib
+import json
+import time
 import uvicorn
 
+import http_client
+from calendar_store import calendar_stores
+from config import CALENDAR_PAGE_SIZE, CALENDAR_MAX_PAGE_SIZE
+from token_validator import token_validator, TokenValidationError
+
 api = FastAPI()
 
-@api.get("/api/calendar")
-async def get_calendar(authorization: Optional[str] = Header(None)):
-    """Protected calendar endpoint - requires valid access token"""
+
+def make_etag(body):
+    """Strong ETag: hash of the canonical JSON body"""
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+    return f'"{digest[:32]}"'
+
+
+def not_modified(etag, last_modified, if_none_match, if_modified_since):
+    """RFC 9110 conditional GET: If-None-Match wins over If-Modified-Since"""
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or etag in tags
+    if if_modified_since is not None:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+async def current_user(authorization: Optional[str] = Header(None)):
+    """Claims of the caller's access token - requires valid access token"""
     if not authorization or not authorization.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Missing or invalid token")
     
-    # In production, you'd validate the token with Keycloak
-    # For now, just check it exists
+    # Signature, expiry, audience and issuer are checked locally against
+    # the realm's cached JWKS - no call to Keycloak per request
     token = authorization.replace("Bearer ", "")
-    
-    return {
-        "events": [
-            {"time": "9:00 AM", "title": "Team Standup"},
-            {"time": "2:00 PM", "title": "Client Meeting"},
-            {"time": "4:00 PM", "title": "Code Review"}
-        ]
+    try:
+        return await token_validator.validate(token)
+    except TokenValidationError as e:
+        raise HTTPException(status_code=401, detail=f"Invalid token: {e}",
+                            headers={"WWW-Authenticate": 'Bearer error="invalid_token"'})
+
+
+def time_range(start, end):
+    """Requested [start, end), defaulting to today"""
+    if start is None:
+        start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if end is None:
+        end = start + timedelta(days=1)
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    return start.timestamp(), end.timestamp()
+
+
+@api.get("/api/calendar")
+async def get_calendar(claims: dict = Depends(current_user),
+                       start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       limit: int = Query(CALENDAR_PAGE_SIZE, ge=1, le=CALENDAR_MAX_PAGE_SIZE),
+                       cursor: Optional[str] = None,
+                       if_none_match: Optional[str] = Header(None),
+                       if_modified_since: Optional[str] = Header(None)):
+    """Protected calendar endpoint - the caller's events overlapping [start, end)
+
+    Defaults to today. Results come in pages of `limit` events; pass the
+    returned next_cursor to get the next page. Responses carry ETag and
+    Last-Modified; a matching If-None-Match (or an If-Modified-Since no
+    older than the data) gets an empty 304.
+    """
+    store = calendar_stores.get(claims.get('sub'))
+    start, end = time_range(start, end)
+    try:
+        events, next_cursor = store.query(start, end, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    body = {"events": events, "next_cursor": next_cursor}
+    etag = make_etag(body)
+    # Whole seconds, as HTTP dates have no more; a range that has only just
+    # begun (e.g. the default "today" after midnight) is new content too
+    updated = int(max(store.updated_at, min(start, time.time())))
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(updated, usegmt=True),
+        # Per-user data: caches may keep it but must revalidate every time
+        "Cache-Control": "private, no-cache",
     }
+    if not_modified(etag, updated, if_none_match, if_modified_since):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+@api.get("/api/calendar/stream")
+async def stream_calendar(claims: dict = Depends(current_user),
+                          start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """All of the caller's events overlapping [start, end) as NDJSON, one event per line"""
+    store = calendar_stores.get(claims.get('sub'))
+    start, end = time_range(start, end)
+    lines = (json.dumps(event) + "\n" for event in store.iter_range(start, end))
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+@api.post("/api/calendar/import")
+async def import_calendar(claims: dict = Depends(current_user), events: List[dict] = Body(...)):
+    """Bulk-add events ({start, end, title}; times as ISO 8601 or epoch seconds)"""
+    store = calendar_stores.get(claims.get('sub'))
+    try:
+        # One sort of the whole calendar; keep it off the event loop
+        imported = await asyncio.to_thread(store.bulk_import, events)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"imported": imported, "total": len(store)}
+
+@api.get("/api/stats")
+async def stats():
+    """Claims cache hit rate and size"""
+    return {"claims_cache": token_validator.cache.stats()}
+
+@api.on_event("shutdown")
+async def shutdown():
+    await http_client.close()
 
 if __name__ == "__main__":
-    uvicorn.run(api, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(api, host="0.0.0.0", port=8000)
@@ -5,6 +5,26 @@ from api.routes import router
 app = FastAPI(title= "MCP Agent - GitHub OAuth")
 app.include_router(router=router)
 
+@app.on_event("startup")
+async def startup():
+    from auth.refresh import token_refresher
+    from auth.flow_store import flow_store
+    token_refresher.start()
+    flow_store.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    from mcp_client.pool import mcp_pool
+    from audit.logger import audit_logger
+    from auth.refresh import token_refresher
+    from auth.http_client import http_client
+    from auth.flow_store import flow_store
+    await token_refresher.stop()
+    await flow_store.stop()
+    await mcp_pool.close_all()
+    await http_client.close()
+    await audit_logger.close()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
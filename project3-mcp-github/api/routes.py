@@ -1,16 +1,56 @@
-from fastapi import APIRouter, Request 
-from fastapi.responses import RedirectResponse, HTMLResponse
+import asyncio
+import hmac
+import html
+import json
+import logging
+import time
+import urllib.parse
+from fastapi import APIRouter, Depends, Header, HTTPException, Request 
+from fastapi.responses import RedirectResponse, HTMLResponse, StreamingResponse
 from auth.github_oauth import GitHubOAuth 
 from auth.token_store import TokenStore
 from auth.keycloak_auth import KeycloakOAuth 
+from auth.flow_store import flow_store, FlowLimitError
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 github_oauth = GitHubOAuth()
 token_store = TokenStore()
 keycloak_oauth = KeycloakOAuth()
 
-## temp storage for OAuth state (to use session storage in production)
-oauth_state = {}
+if urllib.parse.urlsplit(github_oauth.redirect_uri).netloc != urllib.parse.urlsplit(keycloak_oauth.redirect_uri).netloc:
+    # The GitHub flow is started from the Keycloak callback, and its binding cookie won't reach another host
+    logger.warning(f"GitHub callback {github_oauth.redirect_uri} is not on the Keycloak callback's host "
+                   f"({keycloak_oauth.redirect_uri}); GitHub logins after Keycloak will be refused")
+
+def _flow_cookie(provider: str) -> str:
+    return f"oauth_flow_{provider}"
+
+def _start_flow(oauth, provider: str, user_id: str = None):
+    """Redirect to the provider, remembering the login flow under its OAuth state
+    and binding it to this browser with a cookie"""
+    authorization_url, state = oauth.get_authorization_url()
+    try:
+        binding = flow_store.create(state, provider, user_id)
+    except FlowLimitError as e:
+        logger.warning(f"Refusing {provider} login: {str(e)}")
+        return HTMLResponse("<h1>Too many logins in progress, please try again shortly</h1>", status_code=503)
+    response = RedirectResponse(authorization_url)
+    # Lax still sends it on the provider's top-level redirect back to the callback
+    response.set_cookie(_flow_cookie(provider), binding, max_age=int(flow_store.ttl), path='/callback',
+                        httponly=True, samesite='lax', secure=oauth.redirect_uri.startswith('https'))
+    return response
+
+
+def _pop_flow(request: Request, provider: str):
+    """The flow this callback completes, by its OAuth state (single use) and browser binding"""
+    return flow_store.pop(request.query_params.get('state'), provider,
+                          request.cookies.get(_flow_cookie(provider)))
+
+
+def _expired_flow() -> HTMLResponse:
+    return HTMLResponse('<h1>Login expired or invalid</h1><a href="/login">Start again</a>', status_code=400)
 
 @router.get('/')
 async def home():
@@ -24,34 +64,30 @@ async def login_github():
     """
     Redirects user to GitHub for Authorization
     """
-    authorization_url, state = github_oauth.get_authorization_url()
-    oauth_state['state'] = state 
-    return RedirectResponse(authorization_url)
+    return _start_flow(github_oauth, 'github')
 
 @router.get("/callback/github")
 async def callback_github(request: Request):
     """
     Handle GitHub OAuth callback
     """
-    authorization_response = str(request.url)
-    access_token = github_oauth.exchange_code_for_token(authorization_response)
+    flow = _pop_flow(request, 'github')
+    if flow is None:
+        return _expired_flow()
 
-    #DEBUG
-    print(f"DEBUG: in GitHub callback: oauth_state = {oauth_state}")
+    authorization_response = str(request.url)
+    token = await github_oauth.exchange_code_for_token(authorization_response)
 
     # Store token (using 'default_user' for now, will use real user ID in Phase 5)
     #token_store.store_token('default_user', 'github', access_token)
     
     # Get user_id (from Keycloak login or fallback to default)
-    user_id = oauth_state.get('current_user', 'default_user')
-    print(f"DEBUG: Using user_id = {user_id}")
+    user_id = flow['user_id'] or 'default_user'
 
-    # Store token for this user
-    token_store.store_token(user_id, 'github', access_token)
+    # Store token for this user (with refresh token and expiry, if GitHub issued them)
+    token_store.store_token_response(user_id, 'github', token)
+    logger.info(f"Stored GitHub token for {user_id}")
 
-    print("Access token: ", access_token)
-    print("Type : ", type(access_token))
-    #return {"debug : ", str(access_token)}
     # return {
     #     "message": "GitHub authentication successful!", 
     #     "token_stored": True,
@@ -61,6 +97,12 @@ async def callback_github(request: Request):
     return RedirectResponse(url=f"/success?user={user_id}")
 
 
+@router.get("/auth/flows")
+async def login_flow_stats():
+    """Pending and completed OAuth login flows"""
+    return flow_store.stats()
+
+
 @router.get("/token/status")
 async def token_status():
     """Check if GitHub token exists"""
@@ -98,30 +140,29 @@ async def login(user: str = "default_user"):
 
 @router.get("/login/keycloak")
 async def login_keycloak():
-    authorization_url, state = keycloak_oauth.get_authorization_url()
-    print(f"Authorization URL: {authorization_url}")
-    print(f"Redirect URI in code: {keycloak_oauth.redirect_uri}")
-    oauth_state['keycloak_state'] = state
-    return RedirectResponse(authorization_url)
+    logger.debug(f"Keycloak redirect URI: {keycloak_oauth.redirect_uri}")
+    return _start_flow(keycloak_oauth, 'keycloak')
 
 @router.get("/callback/keycloak")
 async def callback_keycloak(request: Request):
+    if _pop_flow(request, 'keycloak') is None:
+        return _expired_flow()
+
     authorization_response = str(request.url)
-    token = keycloak_oauth.exchange_code_for_token(authorization_response)
+    token = await keycloak_oauth.exchange_code_for_token(authorization_response)
     
     # Get user info
-    user_info = keycloak_oauth.get_user_info(token['access_token'])
+    user_info = await keycloak_oauth.get_user_info(token['access_token'])
     user_id = user_info['preferred_username']  # e.g., 'sarah'
 
-    print(f"DEBUG: User info = {user_info}" )
-    print(f"DEBUG: User ID = {user_id}")
-    
-    # Store user session (simple approach)
-    oauth_state['current_user'] = user_id
-    print(f"DEBUG: oauth_state = {oauth_state}")
+    logger.info(f"Keycloak login for {user_id}")
     
-    # Now redirect to GitHub OAuth
-    return RedirectResponse("/login/github")
+    # Keep the Keycloak tokens so the background refresher can renew them
+    token_store.store_token_response(user_id, 'keycloak', token)
+
+    # Now redirect to GitHub OAuth; the GitHub flow carries the user, so the
+    # GitHub callback links the token to them even with concurrent logins
+    return _start_flow(github_oauth, 'github', user_id)
 
 
 @router.get("/chat")
@@ -290,8 +331,21 @@ async def chat_interface(user: str = "sarah"):
 </html>
     """)
 
+async def run_until_disconnected(http_request: Request, coro, poll_interval: float = 0.5):
+    """Await coro, cancelling it if the HTTP client goes away first"""
+    task = asyncio.create_task(coro)
+    while True:
+        done, _ = await asyncio.wait({task}, timeout=poll_interval)
+        if done:
+            return task.result()
+        if await http_request.is_disconnected():
+            logger.info("Client disconnected, cancelling query")
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            return None
+
 @router.post("/query")
-async def process_query(request: dict):
+async def process_query(request: dict, http_request: Request):
     """Process user query via agent"""
     from llm.agent import Agent
     
@@ -299,16 +353,145 @@ async def process_query(request: dict):
     user_id = request.get('user_id', 'sarah')
     
     agent = Agent(user_id)
-    result = await agent.process_query(query)
+    result = await run_until_disconnected(http_request, agent.process_query(query))
     
     return {"result": result}
 
+@router.get("/cache/decisions")
+async def decision_cache_stats():
+    """Hit/miss counters for the query-to-decision cache"""
+    from llm.decision_cache import decision_cache
+    return decision_cache.stats()
+
+@router.post("/cache/decisions/opt-out")
+async def decision_cache_opt_out(request: dict):
+    """Enable or disable decision caching for a user"""
+    from llm.decision_cache import decision_cache
+    user_id = request.get('user_id', 'sarah')
+    if request.get('enabled', False):
+        decision_cache.opt_in(user_id)
+    else:
+        decision_cache.opt_out(user_id)
+    return {"user_id": user_id, "cache_enabled": decision_cache.enabled_for(user_id)}
+
+@router.get("/audit/query")
+async def audit_query(user_id: str = None, tool_name: str = None, status: str = None,
+                      since: str = None, until: str = None, cursor: str = None, limit: int = 50):
+    """Indexed audit log query (newest first, cursor-paginated)"""
+    from audit.logger import audit_logger
+    try:
+        return await audit_logger.run_read(audit_logger.query, user_id=user_id, tool_name=tool_name,
+                                           status=status, since=since, until=until,
+                                           cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/audit/search")
+async def audit_search(q: str, user_id: str = None, tool_name: str = None, status: str = None,
+                       cursor: str = None, limit: int = 50):
+    """Full-text search over audited queries, arguments and results (ranked)"""
+    from audit.logger import audit_logger
+    started = time.perf_counter()
+    try:
+        result = await audit_logger.run_read(audit_logger.search, q, user_id=user_id, tool_name=tool_name,
+                                             status=status, cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+def require_audit_admin(authorization: str = Header(None)):
+    """Audit admin actions need Authorization: Bearer <AUDIT_ADMIN_TOKEN>"""
+    from config.settings import AUDIT_ADMIN_TOKEN
+    if not AUDIT_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Audit admin actions are disabled (AUDIT_ADMIN_TOKEN is not set)")
+    scheme, _, token = (authorization or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.encode(), AUDIT_ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Audit admin token required",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+@router.get("/audit/verify", dependencies=[Depends(require_audit_admin)])
+async def audit_verify(full: bool = False):
+    """Verify the audit hash chain from the last verified checkpoint (or all of it)"""
+    from audit.logger import audit_logger
+    # On the reader pool: a full verify re-hashes every segment, and the
+    # writer must not queue up behind it
+    return await audit_logger.run_read(audit_logger.verify, full)
+
+@router.get("/audit/analytics")
+async def audit_analytics(top: int = 10):
+    """Rollups per tool, user, status and hour, with latency percentiles"""
+    from audit.logger import audit_logger
+    return audit_logger.analytics.summary(top=top)
+
+@router.post("/audit/analytics/rebuild", dependencies=[Depends(require_audit_admin)])
+async def audit_analytics_rebuild(top: int = 10):
+    """Recompute the rollups from the segments on disk, without stopping the writer"""
+    from audit.logger import audit_logger
+    await audit_logger.rebuild_analytics()
+    return audit_logger.analytics.summary(top=top)
+
+@router.get("/audit/stream")
+async def audit_stream(http_request: Request, user: str = None, tool: str = None,
+                       status: str = None, after: int = None):
+    """Server-Sent Events tail of new audit entries
+
+    Reconnecting clients send Last-Event-ID (the last seq they saw) and get
+    the entries they missed replayed from the recent-entries buffer.
+    """
+    from audit.logger import audit_logger
+    from config.settings import AUDIT_STREAM_HEARTBEAT
+    last_event_id = http_request.headers.get('last-event-id')
+    after_seq = int(last_event_id) if last_event_id and last_event_id.isdigit() else after
+    subscription = audit_logger.subscribe(user_id=user, tool_name=tool, status=status, after_seq=after_seq)
+
+    async def events():
+        try:
+            yield "retry: 2000\n\n"
+            # A lagged subscriber is dropped; the browser reconnects and replays
+            while not subscription.lagged:
+                entry = await subscription.get(AUDIT_STREAM_HEARTBEAT)
+                if entry is None:
+                    if await http_request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"id: {entry['seq']}\nevent: audit\ndata: {json.dumps(entry)}\n\n"
+        finally:
+            audit_logger.unsubscribe(subscription)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def _audit_row(log: dict) -> str:
+    cells = [html.escape(str(log.get(key))) for key in ('timestamp', 'user_id', 'query', 'tool_name')]
+    status = html.escape(str(log.get('status')))
+    return "<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + f'<td class="{status}">{status}</td></tr>'
+
 @router.get("/audit")
-async def audit_logs():
+async def audit_logs(user: str = None, tool: str = None, status: str = None,
+                     since: str = None, until: str = None, cursor: str = None):
     """Display audit logs"""
     from audit.logger import audit_logger
-    logs = audit_logger.get_logs(limit=100)
+    try:
+        page = await audit_logger.run_read(audit_logger.query, user_id=user, tool_name=tool, status=status,
+                                           since=since, until=until, cursor=cursor, limit=100)
+    except ValueError as e:
+        return HTMLResponse(f"<h1>{html.escape(str(e))}</h1>", status_code=400)
+    logs = list(reversed(page['entries']))
+    filters = {k: v for k, v in {"user": user, "tool": tool, "status": status,
+                                 "since": since, "until": until}.items() if v}
+    older_link = (f'<a href="/audit?{urllib.parse.urlencode({**filters, "cursor": page["next_cursor"]})}">Older entries</a>'
+                  if page['next_cursor'] else '')
     
+    # Only the latest page tails new entries; older pages and closed
+    # time ranges are static
+    live = cursor is None and until is None
+    stream_params = urllib.parse.urlencode({k: v for k, v in {
+        "user": user, "tool": tool, "status": status,
+        "after": page['entries'][0].get('seq') if page['entries'] else None}.items() if v is not None})
+    value = lambda v: html.escape(v or '', quote=True)
+
     return HTMLResponse(f"""
 <!DOCTYPE html>
 <html>
@@ -322,12 +505,22 @@ async def audit_logs():
         tr:nth-child(even) {{ background-color: #f2f2f2; }}
         .success {{ color: green; }}
         .error {{ color: red; }}
+        #live {{ color: #666; font-style: italic; }}
     </style>
 </head>
 <body>
     <h1>🔍 Audit Logs</h1>
-    <p><a href="/chat">Back to Chat</a></p>
+    <p><a href="/chat">Back to Chat</a> | <a href="/audit">Latest</a> <span id="live"></span></p>
+    <form method="get" action="/audit">
+        <input name="user" placeholder="User" value="{value(user)}">
+        <input name="tool" placeholder="Tool" value="{value(tool)}">
+        <input name="status" placeholder="Status" value="{value(status)}">
+        <input name="since" placeholder="Since (ISO time)" value="{value(since)}">
+        <input name="until" placeholder="Until (ISO time)" value="{value(until)}">
+        <button type="submit">Filter</button>
+    </form>
     <table>
+        <thead>
         <tr>
             <th>Timestamp</th>
             <th>User</th>
@@ -335,16 +528,38 @@ async def audit_logs():
             <th>Tool</th>
             <th>Status</th>
         </tr>
-        {''.join([f'''
-        <tr>
-            <td>{log['timestamp']}</td>
-            <td>{log['user_id']}</td>
-            <td>{log['query']}</td>
-            <td>{log['tool_name']}</td>
-            <td class="{log['status']}">{log['status']}</td>
-        </tr>
-        ''' for log in reversed(logs)])}
+        </thead>
+        <tbody id="audit-rows">
+        {''.join(_audit_row(log) for log in reversed(logs))}
+        </tbody>
     </table>
+    <p>{older_link}</p>
+
+    <script>
+        const live = {'true' if live else 'false'};
+        const maxRows = 500;
+        const rows = document.getElementById('audit-rows');
+        const status = document.getElementById('live');
+
+        function addRow(log) {{
+            const tr = document.createElement('tr');
+            for (const key of ['timestamp', 'user_id', 'query', 'tool_name', 'status']) {{
+                const td = document.createElement('td');
+                td.textContent = log[key];
+                if (key === 'status') td.className = log[key];
+                tr.appendChild(td);
+            }}
+            rows.insertBefore(tr, rows.firstChild);
+            while (rows.children.length > maxRows) rows.lastChild.remove();
+        }}
+
+        if (live) {{
+            const source = new EventSource('/audit/stream?{stream_params}');
+            source.addEventListener('audit', (e) => addRow(JSON.parse(e.data)));
+            source.onopen = () => {{ status.textContent = '● live'; }};
+            source.onerror = () => {{ status.textContent = 'reconnecting...'; }};
+        }}
+    </script>
 </body>
 </html>
-    """)
\ No newline at end of file
+    """)
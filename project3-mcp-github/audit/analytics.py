@@ -0,0 +1,228 @@
+import bisect
+import json
+import os
+import sys
+import threading
+import time
+import logging
+
+from config.settings import (
+    AUDIT_ANALYTICS_FILE,
+    AUDIT_ANALYTICS_HOURS,
+    AUDIT_ANALYTICS_SNAPSHOT_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open
+LATENCY_BUCKETS_MS = [10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+
+def _counts() -> dict:
+    return {"total": 0, "success": 0, "error": 0}
+
+
+def _histogram() -> list:
+    return [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+def _percentile(histogram: list, fraction: float):
+    """Upper bound of the bucket holding the given fraction of samples"""
+    total = sum(histogram)
+    if not total:
+        return None
+    running = 0
+    for bound, count in zip(LATENCY_BUCKETS_MS + [None], histogram):
+        running += count
+        if running >= fraction * total:
+            return bound
+    return None
+
+
+class AuditAnalytics:
+    """Incremental rollups over the audit log.
+
+    Counts per tool, user, status and hour bucket plus per-tool latency
+    histograms (timings.total_ms) are updated as each batch is written, so
+    summary() costs the same regardless of history length. State is
+    snapshotted to AUDIT_ANALYTICS_FILE with the last seq it covers; on
+    startup the snapshot is loaded and any newer entries are replayed from
+    the index. Only the last AUDIT_ANALYTICS_HOURS hour buckets are kept.
+    With path=None nothing is snapshotted (a rebuild in progress).
+    """
+
+    def __init__(self, path: str = AUDIT_ANALYTICS_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._last_snapshot = time.monotonic()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.last_seq = 0
+            self.by_tool = {}
+            self.by_user = {}
+            self.by_status = {}
+            self.by_hour = {}
+            self.latency = {}
+
+    def add(self, entries: list):
+        """Fold written entries into the rollups (runs on the audit writer thread)"""
+        if not entries:
+            return
+        with self._lock:
+            for entry in entries:
+                # Entries migrated from the JSON array file have no seq
+                seq = entry.get('seq') or self.last_seq + 1
+                if seq <= self.last_seq:
+                    continue
+                self._add(entry)
+                self.last_seq = seq
+            self._prune_hours()
+        if time.monotonic() - self._last_snapshot >= AUDIT_ANALYTICS_SNAPSHOT_INTERVAL:
+            self.save()
+
+    def _add(self, entry: dict):
+        status = entry.get('status') or 'unknown'
+        tool = entry.get('tool_name') or 'none'
+        for table, key in ((self.by_tool, tool), (self.by_user, entry.get('user_id') or 'unknown'),
+                           (self.by_hour, (entry.get('timestamp') or '')[:13])):
+            counts = table.setdefault(key, _counts())
+            counts['total'] += 1
+            counts[status] = counts.get(status, 0) + 1
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+
+        total_ms = (entry.get('timings') or {}).get('total_ms')
+        if total_ms is not None:
+            histogram = self.latency.setdefault(tool, _histogram())
+            histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, total_ms)] += 1
+
+    def _prune_hours(self):
+        if len(self.by_hour) > AUDIT_ANALYTICS_HOURS:
+            for hour in sorted(self.by_hour)[:len(self.by_hour) - AUDIT_ANALYTICS_HOURS]:
+                del self.by_hour[hour]
+
+    @staticmethod
+    def _rates(table: dict) -> dict:
+        return {key: {**counts, "error_rate": round(counts.get('error', 0) / counts['total'], 4)}
+                for key, counts in table.items()}
+
+    def summary(self, top: int = 10) -> dict:
+        """Current rollups; tools and users sorted by volume, top N of each"""
+        with self._lock:
+            tools = self._rates(self.by_tool)
+            users = self._rates(self.by_user)
+            latency = {
+                tool: {"buckets_ms": LATENCY_BUCKETS_MS, "counts": list(histogram),
+                       "p50_ms": _percentile(histogram, 0.5), "p95_ms": _percentile(histogram, 0.95),
+                       "p99_ms": _percentile(histogram, 0.99)}
+                for tool, histogram in self.latency.items()
+            }
+            total = sum(self.by_status.values())
+            summary = {
+                "last_seq": self.last_seq,
+                "total": total,
+                "by_status": dict(self.by_status),
+                "error_rate": round(self.by_status.get('error', 0) / total, 4) if total else 0.0,
+                "by_hour": {hour: dict(counts) for hour, counts in sorted(self.by_hour.items())},
+            }
+        by_volume = lambda table: dict(sorted(table.items(), key=lambda item: item[1]['total'], reverse=True)[:top])
+        summary["top_tools"] = by_volume(tools)
+        summary["top_users"] = by_volume(users)
+        summary["failing_tools"] = dict(sorted(
+            ((tool, counts) for tool, counts in tools.items() if counts.get('error')),
+            key=lambda item: item[1]['error_rate'], reverse=True)[:top])
+        summary["latency"] = latency
+        return summary
+
+    def save(self):
+        """Atomically write the snapshot"""
+        if self.path is None:
+            return
+        with self._lock:
+            state = {
+                "last_seq": self.last_seq,
+                "by_tool": self.by_tool,
+                "by_user": self.by_user,
+                "by_status": self.by_status,
+                "by_hour": self.by_hour,
+                "latency": self.latency,
+            }
+            data = json.dumps(state)
+        tmp_file = self.path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.path)
+        self._last_snapshot = time.monotonic()
+
+    def load(self) -> bool:
+        """Restore the snapshot; False if there is none (or it is unreadable)"""
+        if not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable analytics snapshot {self.path}: {str(e)}")
+            return False
+        with self._lock:
+            self.last_seq = state['last_seq']
+            self.by_tool = state['by_tool']
+            self.by_user = state['by_user']
+            self.by_status = state['by_status']
+            self.by_hour = state['by_hour']
+            self.latency = state['latency']
+        return True
+
+    def catch_up(self, index, segments, batch_size: int = 1000):
+        """Replay indexed entries newer than the snapshot"""
+        start = self.last_seq
+        while True:
+            rows = index.after(self.last_seq, limit=batch_size)
+            if not rows:
+                break
+            self.add(segments.read(rows))
+            # Never re-read the same rows, even if some entries were unreadable
+            self.last_seq = max(self.last_seq, rows[-1][0])
+        if self.last_seq > start:
+            logger.info(f"Audit analytics caught up {start} -> {self.last_seq}")
+            self.save()
+
+    def rebuild(self, segments):
+        """Recompute every rollup from the stored segments"""
+        from audit.segments import open_segment
+        self.reset()
+        for path in segments.segments():
+            with open_segment(path) as f:
+                batch = []
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        batch.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue
+                    if len(batch) >= 1000:
+                        self.add(batch)
+                        batch = []
+                self.add(batch)
+        self.save()
+        logger.info(f"Rebuilt audit analytics up to seq {self.last_seq}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['rebuild']:
+        print("usage: python -m audit.analytics rebuild")
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    from audit.segments import SegmentDirectoryLocked
+    try:
+        from audit.logger import audit_logger
+    except SegmentDirectoryLocked as e:
+        # The server would overwrite the result with its own rollups
+        print(f"{e}: stop the server, or rebuild through it with POST /audit/analytics/rebuild")
+        sys.exit(1)
+    audit_logger.analytics.rebuild(audit_logger.segments)
+    print(json.dumps(audit_logger.analytics.summary(), indent=2))
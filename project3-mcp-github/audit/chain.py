@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import sys
+import time
+import logging
+
+from config.settings import AUDIT_CHECKPOINT_FILE, AUDIT_VERIFY_STATE_FILE
+
+logger = logging.getLogger(__name__)
+
+GENESIS_HASH = "0" * 64
+
+
+def entry_hash(entry: dict) -> str:
+    """SHA-256 of the entry's canonical JSON, excluding its own hash.
+
+    The entry carries prev_hash, so each hash commits to the whole chain
+    before it.
+    """
+    body = {key: value for key, value in entry.items() if key != 'hash'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def merkle_root(leaves: list) -> str:
+    """Merkle root over leaf digests (bytes); an odd node is paired with itself"""
+    if not leaves:
+        return GENESIS_HASH
+    level = leaves
+    while len(level) > 1:
+        if len(level) % 2:
+            level = level + [level[-1]]
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def _checkpoint_hash(checkpoint: dict) -> str:
+    body = {key: value for key, value in checkpoint.items() if key != 'hash'}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def scan_segment(f) -> dict:
+    """Hash every line of an open segment: Merkle root over the raw lines plus the entry chain"""
+    leaves, count, first_seq, last_seq, last_hash = [], 0, None, None, None
+    for line in f:
+        if not line.endswith(b'\n'):
+            break
+        leaves.append(hashlib.sha256(line).digest())
+        entry = json.loads(line)
+        count += 1
+        first_seq = entry.get('seq') if first_seq is None else first_seq
+        last_seq = entry.get('seq')
+        last_hash = entry.get('hash', last_hash)
+    return {"count": count, "first_seq": first_seq, "last_seq": last_seq,
+            "last_hash": last_hash, "merkle_root": merkle_root(leaves)}
+
+
+class Checkpoints:
+    """Append-only file of per-segment Merkle checkpoints.
+
+    Written when a segment is sealed. Each checkpoint records the segment's
+    Merkle root over its raw lines and the hash of its last entry, and is
+    itself chained to the previous checkpoint, so a verified prefix of
+    history can be trusted without re-reading its segments.
+    """
+
+    def __init__(self, path: str = AUDIT_CHECKPOINT_FILE):
+        self.path = path
+
+    def load(self) -> list:
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            return [json.loads(line) for line in f if line.endswith(b'\n')]
+
+    def add(self, segment: str, f):
+        """Checkpoint a sealed segment, given an open (uncompressed) copy of it"""
+        existing = self.load()
+        checkpoint = {
+            "segment": os.path.basename(segment),
+            **scan_segment(f),
+            "sealed_at": time.time(),
+            "prev": existing[-1]['hash'] if existing else GENESIS_HASH,
+        }
+        checkpoint['hash'] = _checkpoint_hash(checkpoint)
+        with open(self.path, 'ab') as out:
+            out.write((json.dumps(checkpoint) + '\n').encode())
+            out.flush()
+            os.fsync(out.fileno())
+        logger.info(f"Audit checkpoint for {checkpoint['segment']}: {checkpoint['merkle_root'][:16]}")
+        return checkpoint
+
+
+class ChainVerifier:
+    """Verifies the audit hash chain, resuming from the last verified checkpoint.
+
+    Sealed segments are re-hashed only once: after a successful run the
+    last verified checkpoint and its hash are saved, and the next run
+    re-checks just the checkpoint chain up to it before verifying newer
+    segments and the active one. full=True ignores the saved state.
+    """
+
+    def __init__(self, segments, checkpoints: Checkpoints, state_file: str = AUDIT_VERIFY_STATE_FILE):
+        self.segments = segments
+        self.checkpoints = checkpoints
+        self.state_file = state_file
+
+    def _load_state(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file, 'r') as f:
+            return json.load(f)
+
+    def _save_state(self, state: dict):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.state_file)
+
+    def _verify_entries(self, f, last_hash: str, errors: list, label: str):
+        """Check each entry's hash and link; returns (count, last_hash)
+
+        last_hash is None until the first chained entry. Entries without a
+        hash are only accepted before it (logged before the chain existed),
+        and the first chained entry must link to the genesis hash.
+        """
+        count = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            entry = json.loads(line)
+            count += 1
+            if 'hash' not in entry:
+                if last_hash is not None:
+                    errors.append(f"{label}: entry seq {entry.get('seq')} has no hash")
+                continue
+            if entry_hash(entry) != entry['hash']:
+                errors.append(f"{label}: entry seq {entry.get('seq')} does not match its hash")
+            if entry.get('prev_hash') != (GENESIS_HASH if last_hash is None else last_hash):
+                errors.append(f"{label}: chain broken before seq {entry.get('seq')}")
+            last_hash = entry['hash']
+        return count, last_hash
+
+    def verify(self, full: bool = False) -> dict:
+        from audit.segments import open_segment
+        started = time.perf_counter()
+        errors = []
+        checkpoints = self.checkpoints.load()
+        state = {} if full else self._load_state()
+        start = state.get('checkpoint', -1)
+
+        # The already-verified prefix: only the checkpoint chain is re-checked
+        prev = GENESIS_HASH
+        for position, checkpoint in enumerate(checkpoints):
+            if checkpoint.get('prev') != prev or _checkpoint_hash(checkpoint) != checkpoint.get('hash'):
+                errors.append(f"checkpoint {position} ({checkpoint.get('segment')}) was altered")
+            prev = checkpoint.get('hash')
+        if 0 <= start < len(checkpoints) and checkpoints[start]['hash'] != state.get('checkpoint_hash'):
+            errors.append("verified checkpoint history was rewritten")
+        elif start >= len(checkpoints):
+            errors.append("checkpoints were removed since the last verification")
+
+        last_hash = checkpoints[start]['last_hash'] if 0 <= start < len(checkpoints) else None
+        directory = self.segments.directory
+        # A segment's newest entry predates its seal, so one sealed before
+        # the cutoff may have been deleted by retention
+        retention_cutoff = time.time() - self.segments.retention_days * 86400
+        verified_segments = verified_entries = 0
+        for position in range(start + 1, len(checkpoints)):
+            checkpoint = checkpoints[position]
+            path = os.path.join(directory, checkpoint['segment'] + '.gz')
+            if not os.path.exists(path):
+                if checkpoint.get('sealed_at', 0) >= retention_cutoff:
+                    errors.append(f"{checkpoint['segment']}: missing but still inside the retention period")
+                # Its checkpoint still anchors the chain
+                last_hash = checkpoint['last_hash']
+                continue
+            with open_segment(path) as f:
+                scanned = scan_segment(f)
+            if scanned['merkle_root'] != checkpoint['merkle_root'] or scanned['count'] != checkpoint['count']:
+                errors.append(f"{checkpoint['segment']}: contents differ from its checkpoint")
+            with open_segment(path) as f:
+                count, last_hash = self._verify_entries(f, last_hash, errors, checkpoint['segment'])
+            if last_hash != checkpoint['last_hash']:
+                errors.append(f"{checkpoint['segment']}: last hash differs from its checkpoint")
+            verified_segments += 1
+            verified_entries += count
+
+        if self.segments.active and os.path.exists(self.segments.active):
+            with open_segment(self.segments.active) as f:
+                count, _ = self._verify_entries(f, last_hash, errors, os.path.basename(self.segments.active))
+            verified_entries += count
+
+        if not errors and checkpoints:
+            self._save_state({"checkpoint": len(checkpoints) - 1, "checkpoint_hash": checkpoints[-1]['hash']})
+        return {
+            "ok": not errors,
+            "errors": errors,
+            "checkpoints": len(checkpoints),
+            "verified_segments": verified_segments,
+            "verified_entries": verified_entries,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+
+if __name__ == '__main__':
+    if not sys.argv[1:] or sys.argv[1] != 'verify':
+        print("usage: python -m audit.chain verify [--full]")
+        sys.exit(2)
+    logging.basicConfig(level=logging.INFO)
+    from audit.segments import SegmentDirectoryLocked
+    try:
+        from audit.logger import audit_logger
+    except SegmentDirectoryLocked as e:
+        print(f"{e}: stop the server, or verify through it with GET /audit/verify")
+        sys.exit(1)
+    report = audit_logger.verify(full='--full' in sys.argv)
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report['ok'] else 1)
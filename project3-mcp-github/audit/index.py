@@ -0,0 +1,247 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+FILTER_COLUMNS = ('user_id', 'tool_name', 'status')
+SEARCH_COLUMNS = ('query', 'arguments', 'result_preview')
+# bm25 column weights: a match in the user's query counts most
+SEARCH_WEIGHTS = (3.0, 1.5, 1.0)
+SEARCH_TERM = re.compile(r'"([^"]*)"(\*?)|(\S+)')
+
+
+def build_match(text: str) -> str:
+    """Turn a search box string into an FTS5 MATCH expression.
+
+    "quoted words" are phrases, a trailing * makes a term or phrase a
+    prefix, OR between terms is kept and everything else is ANDed.
+    Every term is quoted, so FTS5 operators in user input are inert.
+    """
+    parts = []
+    for phrase, phrase_prefix, word in SEARCH_TERM.findall(text):
+        if word == 'OR':
+            if parts and parts[-1] != 'OR':
+                parts.append('OR')
+            continue
+        if word:
+            prefix = word.endswith('*')
+            phrase, phrase_prefix = word.rstrip('*'), '*' if prefix else ''
+        if not phrase.strip():
+            continue
+        parts.append('"' + phrase.replace('"', '""') + '"' + (' *' if phrase_prefix else ''))
+    if parts and parts[-1] == 'OR':
+        parts.pop()
+    return " ".join(parts)
+
+
+def _search_text(entry: dict) -> tuple:
+    arguments = entry.get('arguments')
+    if arguments is not None and not isinstance(arguments, str):
+        arguments = json.dumps(arguments)
+    return entry.get('query'), arguments, entry.get('result_preview')
+
+
+class AuditIndex:
+    """SQLite secondary index over the audit log.
+
+    Each row maps an entry's seq to its user_id, tool_name, status and
+    timestamp, plus the file and byte offset of its line, so queries read
+    only the lines they return. An FTS5 table keyed by seq indexes the
+    query, arguments and result_preview text for search(). The index is
+    rebuilt incrementally from the log files, so deleting it is always safe.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS entries (
+                seq INTEGER PRIMARY KEY,
+                timestamp TEXT NOT NULL,
+                user_id TEXT,
+                tool_name TEXT,
+                status TEXT,
+                file TEXT NOT NULL,
+                offset INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_user ON entries (user_id, seq);
+            CREATE INDEX IF NOT EXISTS idx_entries_tool ON entries (tool_name, seq);
+            CREATE INDEX IF NOT EXISTS idx_entries_status ON entries (status, seq);
+            CREATE INDEX IF NOT EXISTS idx_entries_timestamp ON entries (timestamp);
+            CREATE TABLE IF NOT EXISTS indexed_files (
+                file TEXT PRIMARY KEY,
+                size INTEGER NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5 (
+                query, arguments, result_preview,
+                tokenize = 'unicode61 remove_diacritics 2'
+            );
+        """)
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add(self, file: str, rows: list, size: int):
+        """Index (seq, entry, offset) rows written to file, now size bytes long"""
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(seq, entry.get('timestamp'), entry.get('user_id'), entry.get('tool_name'),
+                  entry.get('status'), file, offset) for seq, entry, offset in rows]
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO entries_fts (rowid, query, arguments, result_preview) VALUES (?, ?, ?, ?)",
+                [(seq, *_search_text(entry)) for seq, entry, offset in rows]
+            )
+            conn.execute("INSERT OR REPLACE INTO indexed_files VALUES (?, ?)", (file, size))
+
+    def indexed_size(self, file: str) -> int:
+        row = self._conn().execute("SELECT size FROM indexed_files WHERE file = ?", (file,)).fetchone()
+        return row[0] if row else 0
+
+    def last_seq(self) -> int:
+        row = self._conn().execute("SELECT MAX(seq) FROM entries").fetchone()
+        return row[0] or 0
+
+    def rename_file(self, old: str, new: str):
+        """Point rows at a file's new path (segment import and sealing)"""
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE entries SET file = ? WHERE file = ?", (new, old))
+            conn.execute("UPDATE indexed_files SET file = ? WHERE file = ?", (new, old))
+
+    def remove_file(self, file: str):
+        """Drop every row for a deleted file"""
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM entries_fts WHERE rowid IN (SELECT seq FROM entries WHERE file = ?)", (file,))
+            conn.execute("DELETE FROM entries WHERE file = ?", (file,))
+            conn.execute("DELETE FROM indexed_files WHERE file = ?", (file,))
+
+    def is_indexed(self, file: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM indexed_files WHERE file = ?", (file,)).fetchone() is not None
+
+    def catch_up(self, file: str, opener=open, batch_size: int = 10000):
+        """Index lines appended to file since it was last indexed
+
+        Pass a different opener for compressed files; those never grow, so
+        they are indexed once, in full.
+        """
+        if not os.path.exists(file):
+            return
+        if opener is open:
+            start = self.indexed_size(file)
+            if os.path.getsize(file) <= start:
+                return
+        elif self.is_indexed(file):
+            return
+        else:
+            start = 0
+        seq = self.last_seq()
+        rows = []
+        with opener(file, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn last line: leave it unindexed
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping unreadable audit line at {file}:{offset}")
+                    offset += len(line)
+                    continue
+                seq = entry.get('seq') or seq + 1
+                rows.append((seq, entry, offset))
+                offset += len(line)
+                if len(rows) >= batch_size:
+                    self.add(file, rows, offset)
+                    rows = []
+        self.add(file, rows, offset)
+        logger.info(f"Audit index caught up on {file} ({offset - start} bytes)")
+
+    def backfill_search(self, read, batch_size: int = 1000):
+        """Add entries indexed before full-text search existed to the FTS table
+
+        read loads entries for (seq, file, offset) rows (SegmentStore.read).
+        """
+        conn = self._conn()
+        start = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM entries_fts").fetchone()[0]
+        if start >= self.last_seq():
+            return
+        seq = start
+        while True:
+            rows = self.after(seq, limit=batch_size)
+            if not rows:
+                break
+            with conn:
+                # Entries of segments deleted meanwhile are missing from read(), so key by seq
+                conn.executemany(
+                    "INSERT OR REPLACE INTO entries_fts (rowid, query, arguments, result_preview) VALUES (?, ?, ?, ?)",
+                    [(entry['seq'], *_search_text(entry)) for entry in read(rows)]
+                )
+            seq = rows[-1][0]
+        logger.info(f"Audit search index backfilled from seq {start} to {seq}")
+
+    def search(self, text: str, user_id: str = None, tool_name: str = None, status: str = None,
+               offset: int = 0, limit: int = 50) -> list:
+        """Return (seq, file, offset, score, snippet) rows for a full-text search, best match first"""
+        match = build_match(text)
+        if not match:
+            return []
+        clauses, params = ["entries_fts MATCH ?"], [match]
+        for column, value in zip(FILTER_COLUMNS, (user_id, tool_name, status)):
+            if value is not None:
+                clauses.append(f"e.{column} = ?")
+                params.append(value)
+        weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+        params.extend([limit, offset])
+        return self._conn().execute(
+            f"SELECT e.seq, e.file, e.offset, bm25(entries_fts, {weights}) AS score, "
+            f"snippet(entries_fts, -1, '[', ']', '...', 12) "
+            f"FROM entries_fts JOIN entries e ON e.seq = entries_fts.rowid "
+            f"WHERE {' AND '.join(clauses)} ORDER BY score, e.seq DESC LIMIT ? OFFSET ?", params
+        ).fetchall()
+
+    def after(self, seq: int, limit: int = 1000) -> list:
+        """Return (seq, file, offset) rows with a seq above the given one, oldest first"""
+        return self._conn().execute(
+            "SELECT seq, file, offset FROM entries WHERE seq > ? ORDER BY seq LIMIT ?", (seq, limit)
+        ).fetchall()
+
+    def query(self, user_id: str = None, tool_name: str = None, status: str = None,
+              since: str = None, until: str = None, before_seq: int = None, limit: int = 50) -> list:
+        """Return (seq, file, offset) rows matching every given filter, newest first"""
+        clauses, params = [], []
+        for column, value in zip(FILTER_COLUMNS, (user_id, tool_name, status)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        if before_seq is not None:
+            clauses.append("seq < ?")
+            params.append(before_seq)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(limit)
+        return self._conn().execute(
+            f"SELECT seq, file, offset FROM entries {where} ORDER BY seq DESC LIMIT ?", params
+        ).fetchall()
@@ -1,54 +1,467 @@
+import asyncio
 import json
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 
+from config.settings import (
+    AUDIT_LOG_FILE,
+    AUDIT_LEGACY_FILE,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL,
+    AUDIT_WRITE_RETRIES,
+    AUDIT_WRITE_RETRY_DELAY,
+    AUDIT_INDEX_FILE,
+    AUDIT_QUERY_MAX_LIMIT,
+    AUDIT_READ_WORKERS,
+    AUDIT_SEGMENT_DIR,
+    AUDIT_SEGMENT_MAX_BYTES,
+    AUDIT_SEGMENT_MAX_AGE,
+    AUDIT_RETENTION_DAYS,
+    AUDIT_RECENT_SIZE,
+    AUDIT_STREAM_QUEUE_SIZE,
+)
+from audit.index import AuditIndex
+from audit.segments import SegmentStore, lock_directory
+from audit.analytics import AuditAnalytics
+from audit.chain import GENESIS_HASH, Checkpoints, ChainVerifier, entry_hash
+
 logger = logging.getLogger(__name__)
 
+# Upper bound for the backoff between retries of a failed batch write
+MAX_RETRY_DELAY = 30.0
+
+
+class AuditWriteError(Exception):
+    """The audit log cannot be written, so no more entries are accepted"""
+
+
+def _parse_cursor(cursor: str):
+    """A page cursor is a non-negative integer; anything else is a ValueError"""
+    if not cursor:
+        return None
+    if not cursor.isdigit():
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return int(cursor)
+
+
+class AuditSubscription:
+    """A live tail of new audit entries matching user/tool/status filters.
+
+    Entries are delivered through a bounded queue. A subscriber that falls
+    AUDIT_STREAM_QUEUE_SIZE entries behind is marked lagged instead of
+    blocking log_query; it should reconnect and replay from its last seq.
+    """
+
+    def __init__(self, loop, user_id: str = None, tool_name: str = None, status: str = None):
+        self.loop = loop
+        self.filters = {"user_id": user_id, "tool_name": tool_name, "status": status}
+        self.queue = asyncio.Queue(maxsize=AUDIT_STREAM_QUEUE_SIZE)
+        self.lagged = False
+
+    def matches(self, entry: dict) -> bool:
+        return all(value is None or entry.get(key) == value for key, value in self.filters.items())
+
+    def _deliver(self, entry: dict):
+        if self.lagged:
+            return
+        try:
+            self.queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self.lagged = True
+            logger.warning(f"Audit subscriber fell behind ({self.queue.maxsize} entries), disconnecting it")
+
+    async def get(self, timeout: float):
+        """Next matching entry, or None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
 class AuditLogger:
+    """Append-only JSON Lines audit log.
+
+    log_query never touches the disk on the event loop: entries go through a
+    bounded asyncio.Queue to a background writer that appends them in
+    batches and fsyncs after each batch. All file writes run on a single
+    worker thread, so entries reach the file in the order they were logged.
+
+    Entries are stored in rotating, gzip-sealed segments (see SegmentStore).
+    Every entry gets a monotonically increasing seq and is hash-chained to
+    the one before it (prev_hash/hash, see audit.chain). The writer records
+    each line's byte offset in an AuditIndex, which serves filtered,
+    paginated queries without loading the log into memory; only the last
+    AUDIT_RECENT_SIZE entries are kept in memory. Queries and searches block
+    on SQLite and gzip reads; async callers go through run_read(), which
+    runs them on a small reader pool instead of the event loop.
+
+    A batch that fails to write is retried, in order and with backoff, until
+    it is on disk; entries behind it wait, so the chain on disk never skips
+    one. Once AUDIT_WRITE_RETRIES attempts have failed, log_query raises
+    AuditWriteError instead of accepting entries that may never be written.
+    """
     _instance = None
-    _audit_file = 'audit_log.json'
-    
+    _audit_file = AUDIT_LOG_FILE
+    _legacy_file = AUDIT_LEGACY_FILE
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._init_writer()
             cls._instance._load_logs()
         return cls._instance
-    
+
+    def _init_writer(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='audit-writer')
+        self._readers = ThreadPoolExecutor(max_workers=AUDIT_READ_WORKERS, thread_name_prefix='audit-reader')
+        self._queue = None
+        self._writer = None
+        self._loop = None
+        self._pending = []
+        self._write_lock = None
+        self._retrying = False
+        self._failed = None
+        self._subscribers = set()
+
     def _load_logs(self):
-        if os.path.exists(self._audit_file):
-            with open(self._audit_file, 'r') as f:
-                self.logs = json.load(f)
+        # One process owns the log; a second one fails here, before it can
+        # migrate, repair, seal or index anything (SegmentDirectoryLocked)
+        self._directory_lock = lock_directory(AUDIT_SEGMENT_DIR)
+        self._migrate_legacy()
+        self.index = AuditIndex(AUDIT_INDEX_FILE)
+        self.checkpoints = Checkpoints()
+        self.segments = SegmentStore(AUDIT_SEGMENT_DIR, self.index, AUDIT_SEGMENT_MAX_BYTES,
+                                     AUDIT_SEGMENT_MAX_AGE, AUDIT_RETENTION_DAYS, self.checkpoints)
+        # The single pre-segment log file becomes the first segment
+        self.segments.open(legacy_file=self._audit_file)
+        self._seq = self.index.last_seq()
+        self.index.backfill_search(self.segments.read)
+        self.analytics = AuditAnalytics()
+        if self.analytics.load():
+            self.analytics.catch_up(self.index, self.segments)
         else:
-            self.logs = []
-    
-    def _save_logs(self):
-        with open(self._audit_file, 'w') as f:
-            json.dump(self.logs, f, indent=2)
-    
-    def log_query(self, user_id: str, query: str, tool_name: str, 
-                  arguments: dict, status: str, result: str = None):
-        """Log an agent query and tool execution"""
+            self.analytics.rebuild(self.segments)
+        self.recent = deque(maxlen=AUDIT_RECENT_SIZE)
+        self.recent.extend(reversed(self.segments.read(self.index.query(limit=AUDIT_RECENT_SIZE))))
+        # The chain continues from the last entry that actually reached disk
+        self._last_hash = self.recent[-1].get('hash', GENESIS_HASH) if self.recent else GENESIS_HASH
+
+    def _migrate_legacy(self):
+        """One-time conversion of the old JSON array file to JSON Lines"""
+        if os.path.exists(self._audit_file) or not os.path.exists(self._legacy_file):
+            return
+        with open(self._legacy_file, 'r') as f:
+            entries = json.load(f)
+        tmp_file = self._audit_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self._audit_file)
+        os.rename(self._legacy_file, self._legacy_file + '.migrated')
+        logger.info(f"Migrated {len(entries)} audit entries from {self._legacy_file} to {self._audit_file}")
+
+    def _append(self, entries: list):
+        """Append entries to the active segment and update the rollups (runs on the writer thread)"""
+        self.segments.append(entries)
+        try:
+            self.analytics.add(entries)
+        except Exception as e:
+            # The entries are on disk; failing here would get them written twice
+            logger.error(f"Failed to update audit analytics: {str(e)}")
+
+    def _enqueue(self, entry: dict):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (scripts): write through
+            self._executor.submit(self._append, [entry]).result()
+            return
+
+        if self._loop is not loop:
+            self._start_writer(loop)
+        try:
+            self._queue.put_nowait(entry)
+            if self._queue.qsize() + len(self._pending) >= AUDIT_BATCH_SIZE:
+                self._batch_full.set()
+        except asyncio.QueueFull:
+            if self._retrying:
+                raise AuditWriteError("Audit queue full while a failed write is being retried")
+            # Backpressure: write everything queued so far, plus this entry,
+            # before returning
+            logger.warning(f"Audit queue full ({self._queue.maxsize}), writing synchronously")
+            batch = self._take_pending()
+            try:
+                self._executor.submit(self._append, batch + [entry]).result()
+            except Exception:
+                self._pending[:0] = batch
+                raise
+
+    def _start_writer(self, loop):
+        if self._queue is not None:
+            leftover = self._take_pending()
+            if leftover:
+                try:
+                    self._executor.submit(self._append, leftover).result()
+                except Exception:
+                    self._pending[:0] = leftover
+                    raise
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self._batch_full = asyncio.Event()
+        self._write_lock = asyncio.Lock()
+        self._writer = loop.create_task(self._run_writer())
+
+    def _take_pending(self) -> list:
+        """Remove and return every entry not yet handed to the writer thread, oldest first"""
+        entries, self._pending = self._pending, []
+        while self._queue is not None and not self._queue.empty():
+            entries.append(self._queue.get_nowait())
+        return entries
+
+    async def _run_writer(self):
+        """Batch queued entries and append them every AUDIT_FLUSH_INTERVAL
+        seconds or AUDIT_BATCH_SIZE entries, whichever comes first"""
+        loop = asyncio.get_running_loop()
+        while True:
+            # Awaiting get() directly (not via wait_for) keeps the dequeue and
+            # the append to _pending in one step, so _take_pending never
+            # misses an entry
+            entry = await self._queue.get()
+            self._pending.append(entry)
+            if len(self._pending) + self._queue.qsize() < AUDIT_BATCH_SIZE:
+                self._batch_full.clear()
+                try:
+                    await asyncio.wait_for(self._batch_full.wait(), AUDIT_FLUSH_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            # Taking the batch under the lock keeps flush() from writing
+            # newer entries ahead of it
+            async with self._write_lock:
+                batch = self._take_pending()
+                if batch:
+                    await self._write_batch(loop, batch)
+
+    async def _write_batch(self, loop, batch: list):
+        """Append batch, retrying with backoff until it is on disk"""
+        delay = AUDIT_WRITE_RETRY_DELAY
+        attempts = 0
+        while True:
+            write = loop.run_in_executor(self._executor, self._append, batch)
+            try:
+                # Shielded: a write already handed to the thread cannot be
+                # stopped, so on cancellation (close()) wait for its outcome
+                await asyncio.shield(write)
+                break
+            except asyncio.CancelledError:
+                try:
+                    await write
+                except Exception:
+                    self._pending[:0] = batch
+                raise
+            except Exception as e:
+                attempts += 1
+                self._retrying = True
+                if attempts >= AUDIT_WRITE_RETRIES:
+                    if self._failed is None:
+                        logger.critical(f"Audit log is not being written, refusing new entries: {str(e)}")
+                    self._failed = e
+                logger.error(f"Failed to write {len(batch)} audit entries "
+                             f"(attempt {attempts}), retrying in {delay:.1f}s: {str(e)}")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # close() writes it with whatever is still queued
+                self._pending[:0] = batch
+                raise
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+        if self._failed is not None:
+            logger.warning(f"Audit writes recovered after {attempts} failed attempts")
+        self._retrying = False
+        self._failed = None
+
+    async def flush(self):
+        """Write every queued entry to disk and wait for it to be fsynced
+
+        Raises if the write fails; the entries stay queued for the writer.
+        """
+        if self._write_lock is None:
+            return
+        async with self._write_lock:
+            batch = self._take_pending()
+            try:
+                # The writer thread is FIFO, so this also waits for in-flight batches
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._append, batch)
+            except Exception:
+                self._pending[:0] = batch
+                raise
+
+    async def close(self):
+        """Flush and stop the background writer (called on shutdown)"""
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(self._executor, self.analytics.save)
+        self._queue = None
+        self._writer = None
+        self._loop = None
+        self._write_lock = None
+
+    def log_query(self, user_id: str, query: str, tool_name: str,
+                  arguments: dict, status: str, result: str = None,
+                  route: str = None, decision_ms: float = None, timings: dict = None):
+        """Log an agent query and tool execution
+
+        route records how the tool was chosen ("rules", "cache" or "llm"),
+        decision_ms how long that choice took and timings the per-stage
+        latencies of the agent pipeline.
+        Raises AuditWriteError while the log cannot be written.
+        """
+        if self._failed is not None:
+            raise AuditWriteError(f"Audit log is not being written: {str(self._failed)}")
         entry = {
+            "seq": self._seq + 1,
             "timestamp": datetime.now().isoformat(),
             "user_id": user_id,
             "query": query,
             "tool_name": tool_name,
             "arguments": arguments,
             "status": status,  # "success" or "error"
-            "result_preview": str(result)[:200] if result else None
+            "result_preview": str(result)[:200] if result else None,
+            "route": route,
+            "decision_ms": round(decision_ms, 2) if decision_ms is not None else None,
+            "timings": timings,
+            "prev_hash": self._last_hash,
         }
-        self.logs.append(entry)
-        self._save_logs()
+        entry["hash"] = entry_hash(entry)
+        # Queued entries are written in order or not at all, so the chain
+        # head can advance now; a failed synchronous write leaves it alone
+        self._enqueue(entry)
+        self._seq, self._last_hash = entry["seq"], entry["hash"]
+        self.recent.append(entry)
+        self._publish(entry)
         logger.info(f"Audit log: {user_id} -> {tool_name} ({status})")
-    
+
+    def subscribe(self, user_id: str = None, tool_name: str = None, status: str = None,
+                  after_seq: int = None) -> AuditSubscription:
+        """Start a live tail; entries after after_seq still in the recent buffer are replayed first"""
+        subscription = AuditSubscription(asyncio.get_running_loop(), user_id, tool_name, status)
+        if after_seq is not None:
+            for entry in self.recent:
+                if entry.get('seq', 0) > after_seq and subscription.matches(entry):
+                    subscription._deliver(entry)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AuditSubscription):
+        self._subscribers.discard(subscription)
+
+    def _publish(self, entry: dict):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        for subscription in list(self._subscribers):
+            if not subscription.matches(entry):
+                continue
+            if subscription.loop is loop:
+                subscription._deliver(entry)
+            elif not subscription.loop.is_closed():
+                subscription.loop.call_soon_threadsafe(subscription._deliver, entry)
+
     def get_logs(self, limit: int = 50):
-        """Get recent audit logs"""
-        return self.logs[-limit:]
-    
+        """Get recent audit logs, oldest first"""
+        if limit <= len(self.recent):
+            return list(self.recent)[-limit:]
+        return list(reversed(self.query(limit=limit)['entries']))
+
     def get_user_logs(self, user_id: str, limit: int = 50):
         """Get logs for specific user"""
-        user_logs = [log for log in self.logs if log['user_id'] == user_id]
-        return user_logs[-limit:]
+        return list(reversed(self.query(user_id=user_id, limit=limit)['entries']))
+
+    async def run_read(self, method, *args, **kwargs):
+        """Run a blocking read such as query() or search() on the reader pool"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._readers, lambda: method(*args, **kwargs))
+
+    def query(self, user_id: str = None, tool_name: str = None, status: str = None,
+              since: str = None, until: str = None, cursor: str = None, limit: int = 50) -> dict:
+        """Indexed audit query, newest first
+
+        Filters combine with AND; since/until are ISO timestamps (until is
+        exclusive). Pass the returned next_cursor back as cursor to get the
+        following page; a malformed cursor raises ValueError. Entries become
+        visible once the writer has flushed them (within AUDIT_FLUSH_INTERVAL).
+        """
+        limit = max(1, min(limit, AUDIT_QUERY_MAX_LIMIT))
+        before_seq = _parse_cursor(cursor)
+        rows = self.index.query(user_id=user_id, tool_name=tool_name, status=status,
+                                since=since, until=until, before_seq=before_seq, limit=limit)
+        entries = self.segments.read(rows)
+        next_cursor = str(rows[-1][0]) if len(rows) == limit else None
+        return {"entries": entries, "next_cursor": next_cursor}
+
+    def verify(self, full: bool = False) -> dict:
+        """Check the hash chain and segment checkpoints (see ChainVerifier)
+
+        Blocking; from async code run it with run_read() so writes carry on.
+        Rotation and retention wait until it is done.
+        """
+        with self.segments.scanning():
+            return ChainVerifier(self.segments, self.checkpoints).verify(full=full)
+
+    async def rebuild_analytics(self) -> dict:
+        """Recompute the analytics rollups from the segments while the server runs
+
+        The segments are re-read on the reader pool into a fresh, unsaved
+        AuditAnalytics. It is then caught up with anything written meanwhile
+        and swapped in on the writer thread, so no batch is missed or
+        counted twice, and only then saved over the old snapshot.
+        """
+        loop = asyncio.get_running_loop()
+        rebuilt = AuditAnalytics(path=None)
+
+        def scan():
+            with self.segments.scanning():
+                rebuilt.rebuild(self.segments)
+
+        def swap():
+            rebuilt.catch_up(self.index, self.segments)
+            rebuilt.path = self.analytics.path
+            self.analytics = rebuilt
+            rebuilt.save()
+
+        await loop.run_in_executor(self._readers, scan)
+        await loop.run_in_executor(self._executor, swap)
+        return rebuilt.summary()
+
+    def search(self, text: str, user_id: str = None, tool_name: str = None, status: str = None,
+               cursor: str = None, limit: int = 50) -> dict:
+        """Full-text search over query, arguments and result_preview, best match first
+
+        "quoted words" match a phrase, word* a prefix, and OR joins
+        alternatives; other terms must all match. Each entry gets its bm25
+        score (lower is better) and a snippet with matches in [brackets].
+        A malformed cursor raises ValueError.
+        """
+        limit = max(1, min(limit, AUDIT_QUERY_MAX_LIMIT))
+        offset = _parse_cursor(cursor) or 0
+        rows = self.index.search(text, user_id=user_id, tool_name=tool_name, status=status,
+                                 offset=offset, limit=limit)
+        entries = self.segments.read([(seq, file, position) for seq, file, position, _, _ in rows])
+        # read() leaves out entries of deleted segments, so match rows by seq, not position
+        matches = {seq: (score, snippet) for seq, _, _, score, snippet in rows}
+        for entry in entries:
+            score, snippet = matches[entry['seq']]
+            entry['score'] = round(score, 4)
+            entry['snippet'] = snippet
+        next_cursor = str(offset + limit) if len(rows) == limit else None
+        return {"entries": entries, "next_cursor": next_cursor}
 
-audit_logger = AuditLogger()
\ No newline at end of file
+audit_logger = AuditLogger()
@@ -0,0 +1,332 @@
+import bisect
+import fcntl
+import gzip
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_NAME = re.compile(r'^segment-(\d{6})\.jsonl(\.gz)?$')
+# Sealed segments are compressed as one gzip member per block of whole lines
+# of about this many bytes, so a read decompresses only the block it needs
+BLOCK_SIZE = 64 * 1024
+
+
+class SegmentDirectoryLocked(RuntimeError):
+    """Another process (normally the running server) owns the audit log"""
+
+
+def lock_directory(directory: str):
+    """Take the exclusive lock on a segment directory for this process
+
+    Returns the open lock file, which holds the lock until it is closed or
+    the process exits. Raises SegmentDirectoryLocked if another process
+    already holds it, so a second writer (or a maintenance command run
+    while the server is up) never touches segments the owner is appending to.
+    """
+    os.makedirs(directory, exist_ok=True)
+    lock_file = open(os.path.join(directory, '.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        raise SegmentDirectoryLocked(f"The audit log in {directory} is in use by another process")
+    return lock_file
+
+
+def open_segment(path: str, mode: str = 'rb'):
+    """Open a segment for binary reading; sealed segments are gzip files.
+
+    Offsets are always positions in the uncompressed stream, so seek() works
+    the same on both (forward seeks on gzip decompress up to the offset; use
+    SegmentStore.read for random access).
+    """
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+class SegmentStore:
+    """Audit log split into numbered JSON Lines segments.
+
+    Only the newest segment is appended to. It is sealed (gzip-compressed)
+    once it exceeds max_bytes or holds entries older than max_age seconds,
+    and sealed segments older than retention_days are deleted together with
+    their index rows. If checkpoints is given, each segment gets a Merkle
+    checkpoint just before it is sealed. All methods except read() run on
+    the audit writer thread.
+
+    A sealed segment is a series of gzip members (still a valid gzip file)
+    with a .blocks file next to it mapping each block's uncompressed offset
+    to its compressed one. Segments sealed before blocks existed have no
+    map and are read by seeking through the gzip stream.
+
+    Long scans over every segment (verification, analytics rebuilds) run
+    inside scanning(); while one is in progress, rotation and retention
+    are deferred instead of renaming or deleting files under it.
+    """
+
+    def __init__(self, directory: str, index, max_bytes: int, max_age: float, retention_days: float,
+                 checkpoints=None):
+        self.directory = directory
+        self.index = index
+        self.checkpoints = checkpoints
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_days = retention_days
+        os.makedirs(directory, exist_ok=True)
+        self.active = None
+        self._active_started = None
+        self._blocks = {}
+        self._scan_lock = threading.RLock()
+
+    def _path(self, number: int) -> str:
+        return os.path.join(self.directory, f"segment-{number:06d}.jsonl")
+
+    def segments(self) -> list:
+        """Every segment path, oldest first"""
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_NAME.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return [path for _, path in sorted(found)]
+
+    def open(self, legacy_file: str = None):
+        """Import a pre-segment log file, repair and index the active segment"""
+        if legacy_file and os.path.exists(legacy_file):
+            self._import_legacy(legacy_file)
+
+        for path in self.segments():
+            if path.endswith('.gz'):
+                self.index.catch_up(path, opener=open_segment)
+        existing = [p for p in self.segments() if not p.endswith('.gz')]
+        if existing and self.checkpoints is not None:
+            checkpointed = {c['segment'] for c in self.checkpoints.load()}
+            if os.path.basename(existing[-1]) in checkpointed:
+                # Crashed between checkpointing and compressing: finish the seal
+                self.index.catch_up(existing[-1])
+                self._seal(existing.pop(), checkpoint=False)
+        if existing:
+            self.active = existing[-1]
+            self._truncate_torn_tail(self.active)
+            self.index.catch_up(self.active)
+            self._active_started = self._first_timestamp(self.active)
+        else:
+            self._start_new_segment()
+        self.enforce_retention()
+
+    def _import_legacy(self, legacy_file: str):
+        numbers = [int(SEGMENT_NAME.match(os.path.basename(p)).group(1)) for p in self.segments()]
+        target = self._path(max(numbers, default=0) + 1)
+        shutil.move(legacy_file, target)
+        self.index.rename_file(legacy_file, target)
+        logger.info(f"Moved {legacy_file} into audit segment {target}")
+
+    @staticmethod
+    def _truncate_torn_tail(path: str):
+        """Drop a partial last line left by a crash, so appends start on a fresh line"""
+        with open(path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            chunk = 4096
+            position = size
+            while position > 0:
+                start = max(0, position - chunk)
+                f.seek(start)
+                data = f.read(position - start)
+                newline = data.rfind(b'\n')
+                if newline != -1:
+                    f.truncate(start + newline + 1)
+                    logger.warning(f"Truncated torn audit line at end of {path}")
+                    return
+                position = start
+            f.truncate(0)
+
+    @staticmethod
+    def _first_timestamp(path: str):
+        with open(path, 'rb') as f:
+            line = f.readline()
+        if not line:
+            return None
+        try:
+            return datetime.fromisoformat(json.loads(line)['timestamp']).timestamp()
+        except (ValueError, KeyError):
+            return os.path.getmtime(path)
+
+    def _start_new_segment(self):
+        numbers = [int(SEGMENT_NAME.match(os.path.basename(p)).group(1)) for p in self.segments()]
+        self.active = self._path(max(numbers, default=0) + 1)
+        open(self.active, 'ab').close()
+        self._active_started = None
+
+    def append(self, entries: list):
+        """Append entries to the active segment, fsync, index, then rotate if due.
+
+        If the write or the indexing fails, the segment is truncated back and
+        the error re-raised, so nothing from the batch is left behind.
+        """
+        if not entries:
+            return
+        lines = [(json.dumps(entry) + '\n').encode() for entry in entries]
+        with open(self.active, 'ab') as f:
+            start = offset = f.tell()
+            try:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+                rows = []
+                for entry, line in zip(entries, lines):
+                    rows.append((entry['seq'], entry, offset))
+                    offset += len(line)
+                self.index.add(self.active, rows, size)
+            except BaseException:
+                # All or nothing, so the caller can retry the same entries
+                f.truncate(start)
+                raise
+        if self._active_started is None:
+            self._active_started = time.time()
+
+        if size >= self.max_bytes or time.time() - self._active_started >= self.max_age:
+            try:
+                self.rotate()
+            except Exception as e:
+                # The entries are durable; rotation is retried on the next append
+                logger.error(f"Failed to rotate audit segment {self.active}: {str(e)}")
+
+    @contextmanager
+    def scanning(self):
+        """Keep sealed segments in place while the caller reads all of them"""
+        with self._scan_lock:
+            yield
+
+    def rotate(self):
+        """Seal the active segment and start a new one (deferred during a scan)"""
+        if not self._scan_lock.acquire(blocking=False):
+            logger.info("Audit segment rotation deferred until the running scan finishes")
+            return
+        try:
+            sealed = self.active
+            self._start_new_segment()
+            self._seal(sealed)
+            self.enforce_retention()
+        finally:
+            self._scan_lock.release()
+
+    def _seal(self, path: str, checkpoint: bool = True):
+        if checkpoint and self.checkpoints is not None:
+            with open(path, 'rb') as f:
+                self.checkpoints.add(path, f)
+        compressed = path + '.gz'
+        blocks = []
+        with open(path, 'rb') as src, open(compressed + '.tmp', 'wb') as dst:
+            block, block_bytes, offset = [], 0, 0
+            for line in src:
+                block.append(line)
+                block_bytes += len(line)
+                if block_bytes >= BLOCK_SIZE:
+                    blocks.append((offset, dst.tell()))
+                    dst.write(gzip.compress(b"".join(block)))
+                    offset += block_bytes
+                    block, block_bytes = [], 0
+            if block:
+                blocks.append((offset, dst.tell()))
+                dst.write(gzip.compress(b"".join(block)))
+        # The map goes first: a .gz without one is still readable, just slowly
+        with open(compressed + '.blocks.tmp', 'w') as f:
+            json.dump(blocks, f)
+        os.replace(compressed + '.blocks.tmp', compressed + '.blocks')
+        mtime = os.path.getmtime(path)
+        os.replace(compressed + '.tmp', compressed)
+        os.utime(compressed, (mtime, mtime))
+        self.index.rename_file(path, compressed)
+        os.remove(path)
+        logger.info(f"Sealed audit segment {compressed}")
+
+    def enforce_retention(self):
+        """Delete sealed segments whose newest entry is past the retention period"""
+        if not self._scan_lock.acquire(blocking=False):
+            return
+        try:
+            self._delete_expired()
+        finally:
+            self._scan_lock.release()
+
+    def _delete_expired(self):
+        cutoff = time.time() - self.retention_days * 86400
+        for path in self.segments():
+            if path.endswith('.gz') and os.path.getmtime(path) < cutoff:
+                self.index.remove_file(path)
+                os.remove(path)
+                self._blocks.pop(path, None)
+                if os.path.exists(path + '.blocks'):
+                    os.remove(path + '.blocks')
+                logger.info(f"Deleted audit segment past retention: {path}")
+
+    def _block_map(self, path: str):
+        """(uncompressed offsets, compressed offsets) of a sealed segment's blocks, or None"""
+        if path not in self._blocks:
+            try:
+                with open(path + '.blocks') as f:
+                    blocks = json.load(f)
+            except FileNotFoundError:
+                blocks = None
+            self._blocks[path] = ([b[0] for b in blocks], [b[1] for b in blocks]) if blocks else None
+        return self._blocks[path]
+
+    def _read_blocks(self, path: str, blocks, offsets: list, entries: list):
+        starts, positions = blocks
+        with open(path, 'rb') as f:
+            current, data = None, b""
+            for offset, position in sorted(offsets):
+                block = bisect.bisect_right(starts, offset) - 1
+                if block != current:
+                    f.seek(positions[block])
+                    end = positions[block + 1] if block + 1 < len(positions) else None
+                    data = gzip.decompress(f.read(end - positions[block]) if end else f.read())
+                    current = block
+                start = offset - starts[block]
+                end = data.find(b'\n', start)
+                entries[position] = json.loads(data[start:end if end != -1 else None])
+
+    def read(self, rows: list) -> list:
+        """Load the entries for (seq, file, offset) index rows, opening each file once
+
+        Entries in a segment deleted by retention since the index lookup
+        are left out. Entries from before seq numbering (imported legacy
+        logs) get the seq the index assigned them.
+        """
+        by_file = {}
+        for position, (seq, file, offset) in enumerate(rows):
+            by_file.setdefault(file, []).append((offset, position))
+        entries = [None] * len(rows)
+        for file, offsets in by_file.items():
+            if not os.path.exists(file) and os.path.exists(file + '.gz'):
+                # Sealed between the index lookup and this read
+                file += '.gz'
+            try:
+                blocks = self._block_map(file) if file.endswith('.gz') else None
+                if blocks:
+                    self._read_blocks(file, blocks, offsets, entries)
+                    continue
+                with open_segment(file) as f:
+                    for offset, position in sorted(offsets):
+                        f.seek(offset)
+                        entries[position] = json.loads(f.readline())
+            except FileNotFoundError:
+                logger.warning(f"Audit segment {file} was deleted before it could be read")
+        for entry, (seq, _, _) in zip(entries, rows):
+            if entry is not None:
+                entry.setdefault('seq', seq)
+        return [entry for entry in entries if entry is not None]
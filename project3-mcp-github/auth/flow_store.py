@@ -0,0 +1,149 @@
+import asyncio
+import hmac
+import json
+import secrets
+import sqlite3
+import threading
+import time
+import logging
+
+from config.settings import FLOW_DB_FILE, FLOW_TTL, FLOW_MAX_PENDING, FLOW_SWEEP_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+
+class FlowLimitError(Exception):
+    """Too many login flows are pending to start another one"""
+
+
+class FlowStore:
+    """Pending OAuth login flows, keyed by the OAuth state parameter.
+
+    Each login redirect creates a flow row holding the provider, the user
+    it belongs to (known once Keycloak has authenticated them, before the
+    GitHub step) and an expiry FLOW_TTL seconds out; the callback pops the
+    row for the state it was given, so one flow can only complete once and
+    never sees another user's login. Each flow also gets a random binding,
+    set as a cookie in the browser that started it; pop only completes the
+    flow when the callback presents the same value, so a login link cannot
+    be finished in someone else's browser. Rows live in SQLite (WAL) so a
+    callback may land on any worker. At most FLOW_MAX_PENDING flows can
+    be pending, and a background task deletes expired ones every
+    FLOW_SWEEP_INTERVAL seconds.
+    """
+
+    def __init__(self, db_file: str = FLOW_DB_FILE, ttl: float = FLOW_TTL,
+                 max_pending: int = FLOW_MAX_PENDING, sweep_interval: float = FLOW_SWEEP_INTERVAL):
+        self.db_file = db_file
+        self.ttl = ttl
+        self.max_pending = max_pending
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        self._task = None
+        self.started = 0
+        self.completed = 0
+        self.rejected = 0
+        self.expired = 0
+        self._conn().execute("""
+            CREATE TABLE IF NOT EXISTS oauth_flows (
+                state TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                user_id TEXT,
+                data TEXT,
+                expires_at REAL NOT NULL
+            )
+        """)
+        columns = {row[1] for row in self._conn().execute("PRAGMA table_info(oauth_flows)")}
+        if 'binding' not in columns:
+            self._conn().execute("ALTER TABLE oauth_flows ADD COLUMN binding TEXT")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS oauth_flows_expiry ON oauth_flows (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, state: str, provider: str, user_id: str = None, data: dict = None) -> str:
+        """Record a pending flow and return its browser binding; raises
+        FlowLimitError when too many are pending"""
+        now = time.time()
+        binding = secrets.token_urlsafe(32)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pending = conn.execute("SELECT COUNT(*) FROM oauth_flows WHERE expires_at > ?", (now,)).fetchone()[0]
+            if pending >= self.max_pending:
+                conn.execute("ROLLBACK")
+                self.rejected += 1
+                raise FlowLimitError(f"{pending} login flows pending")
+            conn.execute(
+                "INSERT OR REPLACE INTO oauth_flows (state, provider, user_id, data, binding, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (state, provider, user_id, json.dumps(data) if data else None, binding, now + self.ttl)
+            )
+            conn.execute("COMMIT")
+        except FlowLimitError:
+            raise
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.started += 1
+        return binding
+
+    def pop(self, state: str, provider: str, binding: str):
+        """Remove and return the live flow for state ({user_id, data}), or None
+        (also when binding is not the one handed out by create)"""
+        if not state:
+            return None
+        row = self._conn().execute(
+            "DELETE FROM oauth_flows WHERE state = ? AND provider = ? AND expires_at > ? "
+            "RETURNING user_id, data, binding",
+            (state, provider, time.time())
+        ).fetchone()
+        if row is None:
+            return None
+        if not binding or not row[2] or not hmac.compare_digest(binding.encode(), row[2].encode()):
+            # The flow is consumed either way, so a leaked state can't be retried
+            logger.warning(f"Rejected {provider} callback from a browser that did not start the flow")
+            return None
+        self.completed += 1
+        return {"user_id": row[0], "data": json.loads(row[1]) if row[1] else {}}
+
+    def sweep(self) -> int:
+        """Delete expired flows; returns how many"""
+        cursor = self._conn().execute("DELETE FROM oauth_flows WHERE expires_at <= ?", (time.time(),))
+        self.expired += cursor.rowcount
+        return cursor.rowcount
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                removed = await asyncio.to_thread(self.sweep)
+                if removed:
+                    logger.info(f"Expired {removed} pending login flows")
+            except sqlite3.Error as e:
+                logger.warning(f"Sweeping login flows failed: {str(e)}")
+
+    def stats(self) -> dict:
+        pending = self._conn().execute("SELECT COUNT(*) FROM oauth_flows WHERE expires_at > ?",
+                                       (time.time(),)).fetchone()[0]
+        return {"pending": pending, "started": self.started, "completed": self.completed,
+                "rejected": self.rejected, "expired": self.expired}
+
+
+flow_store = FlowStore()
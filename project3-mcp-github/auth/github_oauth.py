@@ -2,13 +2,15 @@ import os
 from authlib.integrations.requests_client import OAuth2Session
 from dotenv import load_dotenv 
 
+from auth.http_client import http_client, code_from_response
+
 load_dotenv()
 
 class GitHubOAuth:
     def __init__(self):
         self.client_id = os.getenv('GITHUB_CLIENT_ID')
         self.client_secret = os.getenv('GITHUB_CLIENT_SECRET')
-        self.redirect_uri = os.getenv('http://localhost:8000/callback/github')
+        self.redirect_uri = os.getenv('GITHUB_REDIRECT_URI', 'http://127.0.0.1:8000/callback/github')
         self.scope = 'repo read:user'
 
         self.authorization_endpoint = 'https://github.com/login/oauth/authorize'
@@ -30,18 +32,27 @@ class GitHubOAuth:
         return authorization_url, state 
     
 
-    def exchange_code_for_token(self, authorization_response):
+    async def exchange_code_for_token(self, authorization_response):
         """
         Exchange authorization token for access token
         """
-        session = OAuth2Session(
-            client_id=self.client_id,
-            redirect_uri=self.redirect_uri
-        )
+        code = code_from_response(authorization_response)
+        # Full response: expiring user tokens also carry refresh_token/expires_in
+        return await http_client.token_request(self.token_endpoint, {
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': self.redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
 
-        token = session.fetch_access_token(
-            self.token_endpoint,
-            authorization_response=authorization_response,
-            client_secret = self.client_secret
-        )
-        return token['access_token']
+    async def refresh_token(self, refresh_token):
+        """
+        Exchange a refresh token for a new access token (expiring user tokens only)
+        """
+        return await http_client.token_request(self.token_endpoint, {
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
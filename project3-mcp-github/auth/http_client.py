@@ -0,0 +1,145 @@
+import asyncio
+import random
+import urllib.parse
+import logging
+
+import httpx
+
+from config.settings import (
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_KEEPALIVE,
+    HTTP_MAX_PER_HOST,
+    HTTP_TIMEOUT,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_RETRIES,
+    HTTP_BACKOFF,
+)
+
+logger = logging.getLogger(__name__)
+
+# Safe to resend: the server answered but asked us to come back later
+RETRY_STATUSES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class OAuthError(Exception):
+    """The identity provider answered a token request with an OAuth error"""
+
+    def __init__(self, error: str, description: str = None, status_code: int = None):
+        super().__init__(f"{error}: {description}" if description else error)
+        self.error = error
+        self.description = description
+        self.status_code = status_code
+
+
+def code_from_response(authorization_response: str) -> str:
+    """Authorization code from the provider's redirect back to our callback URL"""
+    params = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(authorization_response).query))
+    if 'error' in params:
+        raise OAuthError(params['error'], params.get('error_description'))
+    if 'code' not in params:
+        raise OAuthError('invalid_request', 'callback has no authorization code')
+    return params['code']
+
+
+class HTTPClient:
+    """Shared async HTTP client for identity provider calls.
+
+    One httpx.AsyncClient per event loop keeps connections alive across
+    requests (HTTP_MAX_CONNECTIONS in total), a semaphore per host caps
+    concurrent requests to any one provider at HTTP_MAX_PER_HOST, and
+    failed requests are retried up to HTTP_RETRIES times with jittered
+    exponential backoff. Connection failures are retried for any method,
+    since the request was never sent; timeouts and 429/502/503/504 only
+    for idempotent methods unless retry_unsafe is set.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._loop = None
+        self._hosts = {}
+
+    def _get_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS,
+                                    max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+                timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            )
+            self._loop = loop
+            self._hosts = {}
+        return self._client
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        if host not in self._hosts:
+            self._hosts[host] = asyncio.Semaphore(HTTP_MAX_PER_HOST)
+        return self._hosts[host]
+
+    @staticmethod
+    def _delay(attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), HTTP_BACKOFF * 2 ** HTTP_RETRIES)
+        return HTTP_BACKOFF * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    async def request(self, method: str, url: str, retry_unsafe: bool = False, **kwargs) -> httpx.Response:
+        client = self._get_client()
+        retry_sent = retry_unsafe or method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            response = None
+            try:
+                async with self._host_limit(url):
+                    response = await client.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES or not retry_sent or attempt >= HTTP_RETRIES:
+                    return response
+                reason = f"HTTP {response.status_code}"
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                if attempt >= HTTP_RETRIES:
+                    raise
+                reason = type(e).__name__
+            except httpx.TransportError as e:
+                if not retry_sent or attempt >= HTTP_RETRIES:
+                    raise
+                reason = type(e).__name__
+            delay = self._delay(attempt, response)
+            attempt += 1
+            logger.warning(f"{method} {url} failed ({reason}), retry {attempt}/{HTTP_RETRIES} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def token_request(self, url: str, data: dict, retry_unsafe: bool = False) -> dict:
+        """POST a form to an OAuth token endpoint and return the token response
+
+        Fields set to None are left out rather than sent empty. Raises
+        OAuthError for error responses, including GitHub's 200-with-error
+        replies.
+        """
+        data = {key: value for key, value in data.items() if value is not None}
+        response = await self.post(url, data=data, headers={'Accept': 'application/json'},
+                                   retry_unsafe=retry_unsafe)
+        try:
+            body = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise OAuthError('invalid_response', response.text[:200], response.status_code)
+        if 'error' in body:
+            raise OAuthError(body['error'], body.get('error_description'), response.status_code)
+        response.raise_for_status()
+        return body
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+http_client = HTTPClient()
@@ -3,6 +3,8 @@ import os
 from authlib.integrations.requests_client import OAuth2Session
 from dotenv import load_dotenv
 
+from auth.http_client import http_client, code_from_response
+
 load_dotenv()
 
 class KeycloakOAuth:
@@ -21,7 +23,6 @@ class KeycloakOAuth:
         #http://localhost:8000/callback/keycloak
 
     def get_authorization_url(self):
-        print(f"DEBUG: redirect_uri = {self.redirect_uri}")
         session = OAuth2Session(
             client_id=self.client_id,
             redirect_uri=self.redirect_uri,
@@ -30,26 +31,32 @@ class KeycloakOAuth:
         authorization_url, state = session.create_authorization_url(
             self.authorization_endpoint
         )
-        print(f"DEBUG: Full auth URL = {authorization_url}")
         return authorization_url, state
     
-    def exchange_code_for_token(self, authorization_response):
-        session = OAuth2Session(
-            client_id=self.client_id,
-            redirect_uri=self.redirect_uri
-        )
-        token = session.fetch_token(
-            self.token_endpoint,
-            authorization_response=authorization_response,
-            client_secret=self.client_secret
-        )
-        return token
+    async def exchange_code_for_token(self, authorization_response):
+        code = code_from_response(authorization_response)
+        return await http_client.token_request(self.token_endpoint, {
+            'grant_type': 'authorization_code',
+            'code': code,
+            'redirect_uri': self.redirect_uri,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
+
+    async def refresh_token(self, refresh_token):
+        """Exchange a refresh token for a new token set"""
+        return await http_client.token_request(self.token_endpoint, {
+            'grant_type': 'refresh_token',
+            'refresh_token': refresh_token,
+            'client_id': self.client_id,
+            'client_secret': self.client_secret,
+        })
     
-    def get_user_info(self, access_token):
+    async def get_user_info(self, access_token):
         """Get user details from Keycloak"""
-        import requests
-        response = requests.get(
+        response = await http_client.get(
             self.userinfo_endpoint,
             headers={'Authorization': f'Bearer {access_token}'}
         )
-        return response.json()
\ No newline at end of file
+        response.raise_for_status()
+        return response.json()
@@ -0,0 +1,158 @@
+import asyncio
+import random
+import sqlite3
+import time
+import logging
+
+from auth.http_client import OAuthError
+from auth.token_store import TokenStore, token_store
+from config.settings import (
+    TOKEN_REFRESH_MARGIN,
+    TOKEN_REFRESH_JITTER,
+    TOKEN_REFRESH_MAX_CONCURRENCY,
+    TOKEN_REFRESH_CHECK_INTERVAL,
+    TOKEN_REFRESH_MAX_BACKOFF,
+)
+
+logger = logging.getLogger(__name__)
+
+# OAuth errors meaning the refresh token itself is no longer usable
+# (bad_refresh_token is GitHub's variant)
+REJECTED_ERRORS = {'invalid_grant', 'invalid_client', 'unauthorized_client', 'bad_refresh_token'}
+
+
+def _default_providers() -> dict:
+    from auth.github_oauth import GitHubOAuth
+    from auth.keycloak_auth import KeycloakOAuth
+    return {'github': GitHubOAuth().refresh_token, 'keycloak': KeycloakOAuth().refresh_token}
+
+
+class TokenRefresher:
+    """Background task renewing stored tokens shortly before they expire.
+
+    A token is due TOKEN_REFRESH_MARGIN seconds before expires_at, minus a
+    random jitter of up to TOKEN_REFRESH_JITTER seconds so tokens issued
+    together are not refreshed together. All due tokens of a user are
+    refreshed by one task at a time (requests for a user already in flight
+    are coalesced), at most TOKEN_REFRESH_MAX_CONCURRENCY calls reach the
+    identity providers at once, and a lease in the token store keeps other
+    workers from refreshing the same token. Request handlers only ever read
+    the token store, so they never wait on a refresh.
+    """
+
+    def __init__(self, store: TokenStore = token_store, providers: dict = None,
+                 margin: float = TOKEN_REFRESH_MARGIN, jitter: float = TOKEN_REFRESH_JITTER,
+                 max_concurrency: int = TOKEN_REFRESH_MAX_CONCURRENCY,
+                 check_interval: float = TOKEN_REFRESH_CHECK_INTERVAL):
+        self.store = store
+        self.providers = providers
+        self.margin = margin
+        self.jitter = jitter
+        self.max_concurrency = max_concurrency
+        self.check_interval = check_interval
+        self._jitters = {}
+        self._backoff = {}
+        self._rejected = set()
+        self._inflight = {}
+        self._semaphore = None
+        self._task = None
+        self.refreshed = 0
+        self.failed = 0
+        self.coalesced = 0
+
+    def _due_at(self, user_id: str, service: str, record: dict) -> float:
+        key = (user_id, service, record['expires_at'])
+        if key not in self._jitters:
+            # Drawn once per issued token, so the due time doesn't move between checks
+            self._jitters = {k: v for k, v in self._jitters.items() if k[:2] != key[:2]}
+            self._jitters[key] = random.uniform(0, self.jitter)
+        due = record['expires_at'] - self.margin - self._jitters[key]
+        _, retry_at = self._backoff.get((user_id, service), (0, 0))
+        return max(due, retry_at)
+
+    def _due(self, now: float):
+        """(user_id, service, record, due_at) for every refreshable token"""
+        for user_id, service, record in self.store.refreshable():
+            if service not in self.providers or (user_id, service, record['refresh_token']) in self._rejected:
+                continue
+            yield user_id, service, record, self._due_at(user_id, service, record)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            if self.providers is None:
+                self.providers = _default_providers()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Token refresher started (margin={self.margin}s, jitter={self.jitter}s)")
+
+    async def stop(self):
+        tasks = [t for t in [self._task, *self._inflight.values()] if t is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._inflight.clear()
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            wake = now + self.check_interval
+            try:
+                for user_id, service, record, due in self._due(now):
+                    if due <= now:
+                        self._schedule(user_id)
+                    else:
+                        wake = min(wake, due)
+            except sqlite3.Error as e:
+                logger.warning(f"Checking tokens for refresh failed: {str(e)}")
+            await asyncio.sleep(max(0.5, wake - time.time()))
+
+    def _schedule(self, user_id: str):
+        task = self._inflight.get(user_id)
+        if task is not None and not task.done():
+            self.coalesced += 1
+            return
+        task = asyncio.create_task(self._refresh_user(user_id))
+        self._inflight[user_id] = task
+        task.add_done_callback(lambda t: self._inflight.pop(user_id, None) if self._inflight.get(user_id) is t else None)
+
+    async def _refresh_user(self, user_id: str):
+        now = time.time()
+        try:
+            for uid, service, record, due in list(self._due(now)):
+                if uid == user_id and due <= now:
+                    await self._refresh(user_id, service, record)
+        except sqlite3.Error as e:
+            logger.warning(f"Refreshing tokens for {user_id} failed: {str(e)}")
+
+    async def _refresh(self, user_id: str, service: str, record: dict):
+        async with self._semaphore:
+            if not self.store.try_lease(user_id, service, self.check_interval * 2):
+                return
+            started = time.perf_counter()
+            try:
+                response = await self.providers[service](record['refresh_token'])
+            except Exception as e:
+                self.failed += 1
+                if isinstance(e, OAuthError) and e.error in REJECTED_ERRORS:
+                    # The provider rejected the refresh token: only a new login helps
+                    self._rejected.add((user_id, service, record['refresh_token']))
+                    logger.warning(f"{service} refresh token rejected for {user_id}: {str(e)}")
+                    return
+                failures = self._backoff.get((user_id, service), (0, 0))[0] + 1
+                delay = min(TOKEN_REFRESH_MAX_BACKOFF, 2 ** failures) * random.uniform(0.5, 1.0)
+                self._backoff[(user_id, service)] = (failures, time.time() + delay)
+                logger.warning(f"Refreshing {service} token for {user_id} failed "
+                               f"(attempt {failures}, retry in {delay:.0f}s): {str(e)}")
+                return
+        self._backoff.pop((user_id, service), None)
+        self.store.store_token_response(user_id, service, response)
+        self.refreshed += 1
+        logger.info(f"Refreshed {service} token for {user_id} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def stats(self) -> dict:
+        return {"refreshed": self.refreshed, "failed": self.failed, "coalesced": self.coalesced,
+                "in_flight": len(self._inflight)}
+
+
+token_refresher = TokenRefresher()
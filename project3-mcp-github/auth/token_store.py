@@ -1,41 +1,203 @@
 import json
 import os
+import sqlite3
+import threading
+import time
+import logging
+
+from config.settings import TOKEN_DB_FILE
+
+logger = logging.getLogger(__name__)
 
 class TokenStore:
+    """Per-user service tokens in SQLite (WAL), shared by every worker process.
+
+    Writes are single-row upserts/deletes, so concurrent callbacks never
+    clobber each other's keys. Reads are served from an in-process copy of
+    the table, reloaded only when PRAGMA data_version says another
+    connection (another thread or worker) has committed since; that check
+    reads the WAL index in shared memory, not the database file. Listeners
+    fire for tokens replaced or deleted here or in another worker.
+
+    Tokens may carry a refresh token and an expiry (epoch seconds), which
+    the background TokenRefresher uses to renew them before they expire.
+    """
     _instance = None
     _token_file = 'tokens.json'
-    
+    _db_file = TOKEN_DB_FILE
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
+            cls._instance._listeners = []
             cls._instance._load_tokens()
         return cls._instance
-    
+
+    def _conn(self) -> sqlite3.Connection:
+        """One connection per thread; data_version is tracked per connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self._db_file, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.data_version = None
+        return conn
+
     def _load_tokens(self):
-        if os.path.exists(self._token_file):
-            with open(self._token_file, 'r') as f:
-                self.tokens = json.load(f)
-        else:
-            self.tokens = {}
-    
-    def _save_tokens(self):
-        print(f"DEBUG: Saving tokens to file {self.tokens}")
-        with open(self._token_file, 'w') as f:
-            json.dump(self.tokens, f)
-        print(f"DEBUG: Tokens saved successfully!")
-    
-    def store_token(self, user_id, service, token):
-        if user_id not in self.tokens:
-            self.tokens[user_id] = {}
-        self.tokens[user_id][service] = token
-        self._save_tokens()
-    
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.tokens = {}
+        self.records = {}
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS tokens (
+                user_id TEXT NOT NULL,
+                service TEXT NOT NULL,
+                token TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (user_id, service)
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(tokens)")}
+        for column, kind in (('refresh_token', 'TEXT'), ('expires_at', 'REAL'), ('refresh_lease', 'REAL')):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE tokens ADD COLUMN {column} {kind}")
+        self._migrate_json()
+        self._refresh(force=True)
+
+    def _migrate_json(self):
+        """One-time import of the old tokens.json file"""
+        if not os.path.exists(self._token_file):
+            return
+        with open(self._token_file, 'r') as f:
+            tokens = json.load(f)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO tokens (user_id, service, token, updated_at) VALUES (?, ?, ?, ?)",
+                [(user_id, service, token, time.time())
+                 for user_id, services in tokens.items() for service, token in services.items()]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        os.rename(self._token_file, self._token_file + '.migrated')
+        logger.info(f"Migrated tokens from {self._token_file} to {self._db_file}")
+
+    def _refresh(self, force: bool = False):
+        """Reload the cache if another connection has committed since we last looked"""
+        conn = self._conn()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if not force and version == self._local.data_version:
+            return
+        rows = conn.execute("SELECT user_id, service, token, refresh_token, expires_at FROM tokens").fetchall()
+        self._local.data_version = version
+        tokens, records = {}, {}
+        for user_id, service, token, refresh_token, expires_at in rows:
+            tokens.setdefault(user_id, {})[service] = token
+            records.setdefault(user_id, {})[service] = {
+                "token": token, "refresh_token": refresh_token, "expires_at": expires_at}
+        with self._lock:
+            old, self.tokens, self.records = self.tokens, tokens, records
+        if not force:
+            # Changed by another worker: let listeners drop stale state
+            for user_id, services in old.items():
+                for service, token in services.items():
+                    if tokens.get(user_id, {}).get(service) != token:
+                        self._notify(user_id, service)
+
+    def add_listener(self, callback):
+        """Register callback(user_id, service) to run when a token changes"""
+        self._listeners.append(callback)
+
+    def _notify(self, user_id, service):
+        for callback in self._listeners:
+            callback(user_id, service)
+
+    def _write(self, sql, params, user_id, service, token, record=None):
+        """Run a single-row write; returns the token it replaced"""
+        self._refresh()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT token FROM tokens WHERE user_id = ? AND service = ?",
+                               (user_id, service)).fetchone()
+            conn.execute(sql, params)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        with self._lock:
+            services = dict(self.tokens.get(user_id, {}))
+            service_records = dict(self.records.get(user_id, {}))
+            if token is None:
+                services.pop(service, None)
+                service_records.pop(service, None)
+            else:
+                services[service] = token
+                service_records[service] = record
+            self.tokens = {**self.tokens, user_id: services}
+            self.records = {**self.records, user_id: service_records}
+        return row[0] if row else None
+
+    def store_token(self, user_id, service, token, refresh_token=None, expires_at=None):
+        """Store (or replace) a token; refresh_token/expires_at enable background refresh"""
+        record = {"token": token, "refresh_token": refresh_token, "expires_at": expires_at}
+        previous = self._write(
+            "INSERT INTO tokens (user_id, service, token, updated_at, refresh_token, expires_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id, service) DO UPDATE SET token = excluded.token, "
+            "updated_at = excluded.updated_at, refresh_token = excluded.refresh_token, "
+            "expires_at = excluded.expires_at, refresh_lease = NULL",
+            (user_id, service, token, time.time(), refresh_token, expires_at), user_id, service, token, record
+        )
+        if previous not in (None, token):
+            self._notify(user_id, service)
+
+    def store_token_response(self, user_id, service, response: dict):
+        """Store an OAuth token endpoint response, keeping its refresh token and expiry"""
+        expires_at = response.get('expires_at')
+        if expires_at is None and response.get('expires_in'):
+            expires_at = time.time() + float(response['expires_in'])
+        # Providers may omit refresh_token on refresh, meaning "keep the old one"
+        refresh_token = response.get('refresh_token') or (
+            self.get_record(user_id, service) or {}).get('refresh_token')
+        self.store_token(user_id, service, response['access_token'], refresh_token, expires_at)
+
+    def get_record(self, user_id, service):
+        """{token, refresh_token, expires_at} for a stored token, or None"""
+        self._refresh()
+        return self.records.get(user_id, {}).get(service)
+
+    def refreshable(self) -> list:
+        """(user_id, service, record) for every token that has a refresh token and an expiry"""
+        self._refresh()
+        return [(user_id, service, record)
+                for user_id, services in self.records.items()
+                for service, record in services.items()
+                if record['refresh_token'] and record['expires_at']]
+
+    def try_lease(self, user_id, service, seconds: float) -> bool:
+        """Claim the right to refresh a token for a while, across all workers"""
+        now = time.time()
+        cursor = self._conn().execute(
+            "UPDATE tokens SET refresh_lease = ? WHERE user_id = ? AND service = ? "
+            "AND (refresh_lease IS NULL OR refresh_lease < ?)",
+            (now + seconds, user_id, service, now)
+        )
+        return cursor.rowcount == 1
+
     def get_token(self, user_id, service):
+        self._refresh()
         return self.tokens.get(user_id, {}).get(service)
-    
+
     def delete_token(self, user_id, service):
-        if user_id in self.tokens and service in self.tokens[user_id]:
-            del self.tokens[user_id][service]
-            self._save_tokens()
+        previous = self._write("DELETE FROM tokens WHERE user_id = ? AND service = ?",
+                               (user_id, service), user_id, service, None)
+        if previous is not None:
+            self._notify(user_id, service)
 
-token_store = TokenStore()
\ No newline at end of file
+token_store = TokenStore()
@@ -0,0 +1,70 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Run against a throwaway audit store, not the real one
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix='bench_audit_'))
+N = 20000
+# Small segments, so incremental verification has sealed history to skip
+os.environ.setdefault('AUDIT_SEGMENT_MAX_BYTES', str(1024 * 1024))
+os.environ.setdefault('AUDIT_QUEUE_SIZE', str(N + 1))
+
+from audit.chain import entry_hash, scan_segment
+from audit.logger import audit_logger
+
+ENTRY = {
+    "seq": 1,
+    "timestamp": "2025-01-01T12:00:00.000000",
+    "user_id": "sarah",
+    "query": "show open issues in pytorch/pytorch",
+    "tool_name": "list_issues",
+    "arguments": {"owner": "pytorch", "repo": "pytorch", "state": "open"},
+    "status": "success",
+    "result_preview": "x" * 200,
+    "route": "rules",
+    "decision_ms": 0.42,
+    "timings": {"connect_ms": 1.2, "decide_ms": 0.4, "call_ms": 310.5, "total_ms": 312.9},
+    "prev_hash": "0" * 64,
+}
+
+
+def per_call_us(fn, n: int = N) -> float:
+    started = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+async def bench():
+    hash_us = per_call_us(lambda: entry_hash(ENTRY))
+
+    log = lambda: audit_logger.log_query("sarah", ENTRY['query'], ENTRY['tool_name'], ENTRY['arguments'],
+                                         "success", ENTRY['result_preview'], route="rules",
+                                         decision_ms=0.42, timings=ENTRY['timings'])
+    log_us = per_call_us(log)
+    await audit_logger.flush()
+
+    line = (json.dumps({**ENTRY, "hash": entry_hash(ENTRY)}) + '\n').encode()
+    segment = line * N
+    started = time.perf_counter()
+    scan_segment(io.BytesIO(segment))
+    scan_s = time.perf_counter() - started
+    mb = len(segment) / 1e6
+
+    print(f"entry_hash:           {hash_us:8.1f} us/entry")
+    print(f"log_query (total):    {log_us:8.1f} us/entry  (hashing {hash_us / log_us:.0%})")
+    print(f"checkpoint/verify:    {mb / scan_s:8.1f} MB/s  ({N / scan_s:,.0f} entries/s)")
+
+    report = audit_logger.verify(full=True)
+    print(f"full verify:          {report['elapsed_ms']:8.1f} ms for {report['verified_entries']} entries")
+    report = audit_logger.verify()
+    print(f"incremental verify:   {report['elapsed_ms']:8.1f} ms")
+
+    await audit_logger.close()
+
+asyncio.run(bench())
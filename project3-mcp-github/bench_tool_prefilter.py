@@ -0,0 +1,61 @@
+import asyncio
+import time
+from statistics import mean
+
+from mcp_client.pool import mcp_pool
+from llm.ollama_client import OllamaClient
+from config.settings import TOOL_PREFILTER_TOP_K
+
+# Labelled queries for the GitHub MCP server: (query, expected tool)
+QUERIES = [
+    ("search for fastapi repositories", "search_repositories"),
+    ("find python machine learning projects", "search_repositories"),
+    ("get file README.md from tiangolo/fastapi", "get_file_contents"),
+    ("show open issues in pytorch/pytorch", "list_issues"),
+    ("search issues mentioning memory leak in numpy", "search_issues"),
+    ("find code that uses asyncio.TaskGroup", "search_code"),
+    ("search for users named octocat", "search_users"),
+    ("list recent commits in 0xchamin/agent-security-and-identity", "list_commits"),
+    ("list pull requests in fastapi/fastapi", "list_pull_requests"),
+    ("get issue 42 in octocat/hello-world", "get_issue"),
+    ("fork the repository octocat/hello-world", "fork_repository"),
+    ("create a new repository called demo-agent", "create_repository"),
+]
+
+
+async def run(llm: OllamaClient, catalog):
+    correct, tokens, latencies = 0, [], []
+    for query, expected in QUERIES:
+        started = time.perf_counter()
+        decision = await llm.select_tool(query, catalog)
+        latencies.append(time.perf_counter() - started)
+        tokens.append(llm.last_prompt_tokens or 0)
+        correct += decision['tool_name'] == expected
+    return mean(tokens), mean(latencies), correct / len(QUERIES)
+
+
+async def bench():
+    async with mcp_pool.acquire('sarah') as mcp:
+        catalog = await mcp.get_catalog()
+    print(f"Catalog: {len(catalog)} tools, top-k = {TOOL_PREFILTER_TOP_K}\n")
+
+    # Non-streaming so Ollama reports prompt_eval_count for every call
+    full = OllamaClient(stream=False, top_k=0)
+    prefiltered = OllamaClient(stream=False, top_k=TOOL_PREFILTER_TOP_K)
+
+    # Embed the catalog once up front so it is not counted per query
+    await prefiltered._retriever.rank(QUERIES[0][0], catalog, k=TOOL_PREFILTER_TOP_K)
+    hits = 0
+    for query, expected in QUERIES:
+        ranked = await prefiltered._retriever.rank(query, catalog, k=TOOL_PREFILTER_TOP_K)
+        hits += expected in [catalog.tools[i].name for i in ranked]
+    print(f"Retrieval recall@{TOOL_PREFILTER_TOP_K}: {hits / len(QUERIES):.0%}\n")
+
+    print(f"{'prompt':<12}{'tokens':>10}{'latency (s)':>14}{'accuracy':>10}")
+    for name, llm in [("full list", full), (f"top-{TOOL_PREFILTER_TOP_K}", prefiltered)]:
+        tokens, latency, accuracy = await run(llm, catalog)
+        print(f"{name:<12}{tokens:>10.0f}{latency:>14.2f}{accuracy:>10.0%}")
+
+    await mcp_pool.close_all()
+
+asyncio.run(bench())
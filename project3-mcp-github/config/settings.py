@@ -0,0 +1,97 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# MCP GitHub server
+MCP_SERVER_COMMAND = "npx"
+MCP_SERVER_ARGS = ["@modelcontextprotocol/server-github"]
+
+# Token store (SQLite in WAL mode, shared by all workers)
+TOKEN_DB_FILE = os.getenv('TOKEN_DB_FILE', 'tokens.sqlite')
+
+# Pending OAuth login flows, keyed by state (same database by default)
+FLOW_DB_FILE = os.getenv('FLOW_DB_FILE', TOKEN_DB_FILE)
+FLOW_TTL = float(os.getenv('FLOW_TTL', '600'))
+FLOW_MAX_PENDING = int(os.getenv('FLOW_MAX_PENDING', '10000'))
+FLOW_SWEEP_INTERVAL = float(os.getenv('FLOW_SWEEP_INTERVAL', '60'))
+
+# Shared async HTTP client for identity provider calls
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_MAX_KEEPALIVE = int(os.getenv('HTTP_MAX_KEEPALIVE', '20'))
+HTTP_MAX_PER_HOST = int(os.getenv('HTTP_MAX_PER_HOST', '20'))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.2'))
+
+# Background token refresh: renew TOKEN_REFRESH_MARGIN seconds (plus up to
+# TOKEN_REFRESH_JITTER) before expiry
+TOKEN_REFRESH_MARGIN = float(os.getenv('TOKEN_REFRESH_MARGIN', '60'))
+TOKEN_REFRESH_JITTER = float(os.getenv('TOKEN_REFRESH_JITTER', '30'))
+TOKEN_REFRESH_MAX_CONCURRENCY = int(os.getenv('TOKEN_REFRESH_MAX_CONCURRENCY', '4'))
+TOKEN_REFRESH_CHECK_INTERVAL = float(os.getenv('TOKEN_REFRESH_CHECK_INTERVAL', '15'))
+TOKEN_REFRESH_MAX_BACKOFF = float(os.getenv('TOKEN_REFRESH_MAX_BACKOFF', '300'))
+
+# MCP session pool
+MCP_POOL_MAX_SIZE = int(os.getenv('MCP_POOL_MAX_SIZE', '16'))
+MCP_POOL_IDLE_TIMEOUT = float(os.getenv('MCP_POOL_IDLE_TIMEOUT', '300'))
+MCP_POOL_HEALTH_INTERVAL = float(os.getenv('MCP_POOL_HEALTH_INTERVAL', '30'))
+MCP_POOL_HEALTH_TIMEOUT = float(os.getenv('MCP_POOL_HEALTH_TIMEOUT', '5'))
+
+# MCP tool catalog cache
+MCP_CATALOG_TTL = float(os.getenv('MCP_CATALOG_TTL', '3600'))
+
+# Ollama LLM
+OLLAMA_HOST = os.getenv('OLLAMA_HOST', 'http://127.0.0.1:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'qwen2.5:7b')
+OLLAMA_MAX_CONCURRENCY = int(os.getenv('OLLAMA_MAX_CONCURRENCY', '2'))
+OLLAMA_TIMEOUT = float(os.getenv('OLLAMA_TIMEOUT', '120'))
+OLLAMA_STREAM_SELECTION = os.getenv('OLLAMA_STREAM_SELECTION', 'true').lower() == 'true'
+OLLAMA_EMBED_MODEL = os.getenv('OLLAMA_EMBED_MODEL', 'nomic-embed-text')
+
+# Embedding prefilter: only the top-k most similar tools go into the
+# selection prompt (0 disables the prefilter)
+TOOL_PREFILTER_TOP_K = int(os.getenv('TOOL_PREFILTER_TOP_K', '8'))
+
+# Query-to-decision cache
+DECISION_CACHE_MAX_SIZE = int(os.getenv('DECISION_CACHE_MAX_SIZE', '1024'))
+DECISION_CACHE_TTL = float(os.getenv('DECISION_CACHE_TTL', '86400'))
+DECISION_CACHE_OPT_OUT = [u for u in os.getenv('DECISION_CACHE_OPT_OUT', '').split(',') if u]
+
+# Rule-based fast path ahead of LLM tool selection
+ROUTER_ENABLED = os.getenv('ROUTER_ENABLED', 'true').lower() == 'true'
+ROUTER_MIN_CONFIDENCE = float(os.getenv('ROUTER_MIN_CONFIDENCE', '0.8'))
+
+# Audit log (JSON Lines segments, written by a background batching writer)
+AUDIT_SEGMENT_DIR = os.getenv('AUDIT_SEGMENT_DIR', 'audit_segments')
+AUDIT_SEGMENT_MAX_BYTES = int(os.getenv('AUDIT_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+AUDIT_SEGMENT_MAX_AGE = float(os.getenv('AUDIT_SEGMENT_MAX_AGE', '86400'))
+AUDIT_RETENTION_DAYS = float(os.getenv('AUDIT_RETENTION_DAYS', '90'))
+AUDIT_RECENT_SIZE = int(os.getenv('AUDIT_RECENT_SIZE', '1000'))
+# Per-segment Merkle checkpoints and hash chain verification progress
+AUDIT_CHECKPOINT_FILE = os.getenv('AUDIT_CHECKPOINT_FILE', 'audit_checkpoints.jsonl')
+AUDIT_VERIFY_STATE_FILE = os.getenv('AUDIT_VERIFY_STATE_FILE', 'audit_verified.json')
+# Bearer token for audit admin actions (verify, analytics rebuild); unset disables them
+AUDIT_ADMIN_TOKEN = os.getenv('AUDIT_ADMIN_TOKEN')
+# Single-file log from before segmentation, imported as the first segment
+AUDIT_LOG_FILE = os.getenv('AUDIT_LOG_FILE', 'audit_log.jsonl')
+AUDIT_LEGACY_FILE = 'audit_log.json'
+AUDIT_INDEX_FILE = os.getenv('AUDIT_INDEX_FILE', 'audit_index.sqlite')
+AUDIT_QUERY_MAX_LIMIT = int(os.getenv('AUDIT_QUERY_MAX_LIMIT', '500'))
+# Threads serving /audit queries, searches and verification off the event loop
+AUDIT_READ_WORKERS = int(os.getenv('AUDIT_READ_WORKERS', '4'))
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '100'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '1.0'))
+# A failed batch write is retried with backoff; after this many attempts new
+# entries are refused until the write goes through
+AUDIT_WRITE_RETRIES = int(os.getenv('AUDIT_WRITE_RETRIES', '5'))
+AUDIT_WRITE_RETRY_DELAY = float(os.getenv('AUDIT_WRITE_RETRY_DELAY', '0.5'))
+# Incremental rollups served by /audit/analytics
+AUDIT_ANALYTICS_FILE = os.getenv('AUDIT_ANALYTICS_FILE', 'audit_analytics.json')
+AUDIT_ANALYTICS_HOURS = int(os.getenv('AUDIT_ANALYTICS_HOURS', '168'))
+AUDIT_ANALYTICS_SNAPSHOT_INTERVAL = float(os.getenv('AUDIT_ANALYTICS_SNAPSHOT_INTERVAL', '60'))
+# Live tail (/audit/stream): per-subscriber buffer and keep-alive interval
+AUDIT_STREAM_QUEUE_SIZE = int(os.getenv('AUDIT_STREAM_QUEUE_SIZE', '1000'))
+AUDIT_STREAM_HEARTBEAT = float(os.getenv('AUDIT_STREAM_HEARTBEAT', '15'))
@@ -1,7 +1,12 @@
 import asyncio
-from mcp_client.client import MCPClient
+import time
+from mcp_client.client import SERVER_COMMAND_LINE
+from mcp_client.catalog import catalog_cache
+from mcp_client.pool import mcp_pool
 from llm.ollama_client import OllamaClient
-from auth.token_store import token_store
+from llm.decision_cache import decision_cache
+from llm.router import router
+from config.settings import ROUTER_ENABLED
 import logging
 
 from audit.logger import audit_logger 
@@ -14,29 +19,134 @@ class Agent:
         self.llm = OllamaClient()
     
     async def process_query(self, user_query: str):
-        """Process natural language query and execute appropriate tool"""
-        
-        async with MCPClient(token_store, self.user_id) as mcp:
-            # Get available tools
-            tools = await mcp.list_tools()
-            
-            # LLM selects tool
-            decision = self.llm.select_tool(user_query, tools.tools)
-            logger.info(f"LLM decision: {decision}")
-            
+        """Process natural language query and execute appropriate tool
+
+        Connecting to the MCP server and choosing a tool run concurrently
+        whenever a catalog for the server is already cached; per-stage
+        timings are logged and stored in the audit entry.
+        """
+        started = time.perf_counter()
+        timings = {}
+        # Checked up front: without a token checkout fails anyway, and only
+        # after the (overlapped) tool selection has paid for an LLM call
+        if not mcp_pool.token_store.get_token(self.user_id, 'github'):
+            logger.error(f"No GitHub token found for user: {self.user_id}")
+            raise ValueError("No GitHub token found")
+
+        # Stage 1: check out a (possibly freshly spawned) MCP session
+        connect = asyncio.create_task(self._connect(timings))
+        try:
+            # Stage 2: choose a tool, overlapping with stage 1 if we can
+            catalog = catalog_cache.latest(SERVER_COMMAND_LINE)
+            if catalog is None:
+                # First query against this server: the catalog has to come from it
+                catalog = await self._fetch_catalog(await connect, timings)
+            try:
+                decision, route = await self._decide(user_query, catalog, timings)
+            except asyncio.TimeoutError:
+                logger.error(f"LLM tool selection timed out after {self.llm.timeout}s")
+                audit_logger.log_query(self.user_id, user_query, 'none', {}, 'timeout',
+                                       route='llm', timings=self._finish(timings, started))
+                return "The language model took too long to respond. Please try again."
+
             if decision['tool_name'] == 'none':
-                audit_logger.log_query(self.user_id, user_query, 'none', {}, 'no_tool')
+                audit_logger.log_query(self.user_id, user_query, 'none', {}, 'no_tool', route=route,
+                                       decision_ms=timings.get('decide_ms'),
+                                       timings=self._finish(timings, started))
                 return "I couldn't find an appropriate tool for that query."
-            
-            try:
-                # Execute tool
-                result = await mcp.call_tool(decision['tool_name'], decision['arguments'])
-                audit_logger.log_query(self.user_id, user_query, 
-                                    decision['tool_name'], decision['arguments'], 
-                                    'success', str(result))
-                return result
-            except Exception as e:
-                audit_logger.log_query(self.user_id, user_query, 
-                                 decision['tool_name'], decision['arguments'], 
-                                 'error', str(e))
-                raise
\ No newline at end of file
+
+            # Stage 3: call the tool on the session from stage 1
+            entry = await connect
+            if entry.client.server_key != catalog.key:
+                # The cached catalog belongs to another server version
+                catalog = await self._fetch_catalog(entry, timings)
+                if decision['tool_name'] not in catalog.by_name:
+                    decision, route = await self._decide(user_query, catalog, timings)
+            return await self._call(entry, user_query, catalog, decision, route, timings, started)
+        finally:
+            self._release(connect)
+
+    async def _connect(self, timings: dict):
+        stage_started = time.perf_counter()
+        entry = await mcp_pool.checkout(self.user_id)
+        timings['connect_ms'] = (time.perf_counter() - stage_started) * 1000
+        return entry
+
+    @staticmethod
+    def _release(connect: asyncio.Task):
+        """Return the session to the pool, now or once the spawn finishes.
+
+        A query that ends early (no tool, LLM timeout) does not wait for or
+        cancel the spawn; the warmed session simply goes back to the pool.
+        """
+        def release(task):
+            if not task.cancelled() and task.exception() is None:
+                mcp_pool.release(task.result())
+
+        if connect.done():
+            release(connect)
+        else:
+            connect.add_done_callback(release)
+
+    async def _fetch_catalog(self, entry, timings: dict):
+        stage_started = time.perf_counter()
+        catalog = await entry.client.get_catalog()
+        timings['catalog_ms'] = (time.perf_counter() - stage_started) * 1000
+        return catalog
+
+    async def _decide(self, user_query: str, catalog, timings: dict):
+        """Deterministic rules first, then a previous decision for the same
+        question, and only then the LLM"""
+        stage_started = time.perf_counter()
+        routed = router.route(user_query, catalog) if ROUTER_ENABLED else None
+        if routed:
+            decision, route = routed.as_decision(), 'rules'
+        else:
+            decision, route = decision_cache.get(self.user_id, user_query, catalog.hash), 'cache'
+        if decision is None:
+            decision, route = await self.llm.select_tool(user_query, catalog), 'llm'
+        timings['decide_ms'] = (time.perf_counter() - stage_started) * 1000
+        logger.info(f"Decision via {route}: {decision}")
+        return decision, route
+
+    async def _call(self, entry, user_query: str, catalog, decision: dict, route: str,
+                    timings: dict, started: float):
+        stage_started = time.perf_counter()
+        # Time at which both the session and the decision were ready
+        timings['ready_ms'] = (stage_started - started) * 1000
+        try:
+            result = await entry.client.call_tool(decision['tool_name'], decision['arguments'])
+        except Exception as e:
+            # The failure may be a dead child process; verify before reuse
+            entry.last_checked = 0
+            decision_cache.invalidate(user_query, self.user_id)
+            timings['call_ms'] = (time.perf_counter() - stage_started) * 1000
+            audit_logger.log_query(self.user_id, user_query, 
+                             decision['tool_name'], decision['arguments'], 
+                             'error', str(e), route=route,
+                             decision_ms=timings.get('decide_ms'),
+                             timings=self._finish(timings, started))
+            raise
+
+        timings['call_ms'] = (time.perf_counter() - stage_started) * 1000
+        if getattr(result, 'isError', False):
+            decision_cache.invalidate(user_query, self.user_id)
+        elif route == 'llm':
+            decision_cache.put(self.user_id, user_query, catalog.hash, decision)
+        audit_logger.log_query(self.user_id, user_query, 
+                            decision['tool_name'], decision['arguments'], 
+                            'success', str(result), route=route,
+                            decision_ms=timings.get('decide_ms'),
+                            timings=self._finish(timings, started))
+        return result
+
+    @staticmethod
+    def _finish(timings: dict, started: float) -> dict:
+        """Round the stage timings and work out what the overlap saved"""
+        timings['total_ms'] = (time.perf_counter() - started) * 1000
+        if 'ready_ms' in timings and 'catalog_ms' not in timings:
+            sequential = timings.get('connect_ms', 0) + timings.get('decide_ms', 0)
+            timings['overlap_saved_ms'] = max(0.0, sequential - timings['ready_ms'])
+        timings = {k: round(v, 1) for k, v in timings.items()}
+        logger.info(f"Query timings (ms): {timings}")
+        return timings
@@ -0,0 +1,120 @@
+import copy
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from config.settings import DECISION_CACHE_MAX_SIZE, DECISION_CACHE_TTL, DECISION_CACHE_OPT_OUT
+
+logger = logging.getLogger(__name__)
+
+# Queries that refer to the asking user; their arguments depend on who asks
+FIRST_PERSON = re.compile(r"\b(i|me|my|mine|myself|i'm|i've)\b")
+# Key owner of decisions that any user may reuse
+SHARED = None
+
+
+class DecisionCache:
+    """LRU/TTL cache of tool decisions keyed by normalized query and catalog hash.
+
+    Entries are tied to the hash of the tool catalog they were made against;
+    when a different hash shows up, every older entry is dropped. A
+    decision is shared between users only if it can't depend on who asked:
+    the query has no first-person words and every argument value appears
+    in the query text. Otherwise (e.g. "list my repos" resolved to an
+    owner) it is cached for the asking user alone.
+    """
+
+    def __init__(self, max_size: int = DECISION_CACHE_MAX_SIZE, ttl: float = DECISION_CACHE_TTL,
+                 opted_out=DECISION_CACHE_OPT_OUT):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._catalog_hash = None
+        self._opted_out = set(opted_out)
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        """Case-fold, collapse whitespace and drop trailing punctuation"""
+        return " ".join(query.casefold().split()).rstrip(" ?.!")
+
+    def enabled_for(self, user_id: str) -> bool:
+        return user_id not in self._opted_out
+
+    def opt_out(self, user_id: str):
+        self._opted_out.add(user_id)
+
+    def opt_in(self, user_id: str):
+        self._opted_out.discard(user_id)
+
+    @classmethod
+    def is_shared(cls, query: str, decision: dict) -> bool:
+        """True if decision follows from the query text alone"""
+        normalized = cls.normalize(query)
+        if FIRST_PERSON.search(normalized):
+            return False
+        for value in (decision.get('arguments') or {}).values():
+            if isinstance(value, (dict, list)) or (value is not None and str(value).casefold() not in normalized):
+                return False
+        return True
+
+    def _check_catalog(self, catalog_hash: str):
+        if catalog_hash != self._catalog_hash:
+            if self._entries:
+                logger.info(f"Tool catalog changed, dropping {len(self._entries)} cached decisions")
+            self._entries.clear()
+            self._catalog_hash = catalog_hash
+
+    def get(self, user_id: str, query: str, catalog_hash: str):
+        """Return a copy of the cached decision, or None on a miss"""
+        if not self.enabled_for(user_id):
+            return None
+        self._check_catalog(catalog_hash)
+        normalized = self.normalize(query)
+        for key in ((user_id, normalized), (SHARED, normalized)):
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+        self.misses += 1
+        return None
+
+    def put(self, user_id: str, query: str, catalog_hash: str, decision: dict):
+        if not self.enabled_for(user_id):
+            return
+        self._check_catalog(catalog_hash)
+        key = (SHARED if self.is_shared(query, decision) else user_id, self.normalize(query))
+        self._entries[key] = (copy.deepcopy(decision), time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, query: str = None, user_id: str = None):
+        """Drop one query's decisions (the shared one and user_id's, or every
+        user's when user_id is None), or everything when query is None"""
+        if query is None:
+            self._entries.clear()
+            return
+        normalized = self.normalize(query)
+        for key in [k for k in self._entries
+                    if k[1] == normalized and (user_id is None or k[0] in (SHARED, user_id))]:
+            del self._entries[key]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+decision_cache = DecisionCache()
@@ -1,31 +1,114 @@
+import asyncio
+import time
 import ollama
 import logging 
 
 import json
 import re 
 
+from config.settings import (
+    OLLAMA_HOST, OLLAMA_MODEL, OLLAMA_MAX_CONCURRENCY, OLLAMA_TIMEOUT, OLLAMA_STREAM_SELECTION,
+    OLLAMA_EMBED_MODEL, TOOL_PREFILTER_TOP_K
+)
+from mcp_client.catalog import ToolCatalog, format_tools
+from llm.tool_selector import JSONObjectScanner, NO_TOOL, extract_decision, parse_decision
+from llm.tool_retriever import ToolRetriever
+
 logger = logging.getLogger(__name__)
 
 class OllamaClient:
-    def __init__(self, model='qwen2.5:7b'):
+    # Shared by every instance: one HTTP connection pool and one
+    # concurrency limit for the whole process
+    _client = None
+    _semaphore = None
+
+    def __init__(self, model=OLLAMA_MODEL, timeout: float = OLLAMA_TIMEOUT,
+                 stream: bool = OLLAMA_STREAM_SELECTION, top_k: int = TOOL_PREFILTER_TOP_K,
+                 embed_model: str = OLLAMA_EMBED_MODEL):
         self.model = model 
+        self.timeout = timeout
+        self.stream = stream
+        self.top_k = top_k
+        self.embed_model = embed_model
+        self.last_decision_ms = None
+        self.last_prompt_tokens = None
+        if OllamaClient._client is None:
+            OllamaClient._client = ollama.AsyncClient(host=OLLAMA_HOST)
+        if OllamaClient._semaphore is None:
+            OllamaClient._semaphore = asyncio.Semaphore(OLLAMA_MAX_CONCURRENCY)
+        # Per instance, so it uses this instance's top_k and embed model;
+        # the catalog embeddings themselves are shared (see ToolRetriever)
+        self._retriever = ToolRetriever(self, top_k)
         logger.info(f"OllamaClient initialized with model: {model}")
 
-    def query(self, prompt: str) -> str:
+    async def query(self, prompt: str) -> str:
         """
-        Send prompt to Ollama and get response
+        Send prompt to Ollama and get response without blocking the event loop
+
+        At most OLLAMA_MAX_CONCURRENCY inferences run at once; raises
+        asyncio.TimeoutError if the inference exceeds self.timeout. Cancelling
+        the awaiting task closes the HTTP request to Ollama.
         """
         logger.info(f"Querying LLM with prompt length : {len(prompt)}")
 
-        response = ollama.chat(
-            model = self.model, 
-            messages = [{"role": "user", "content": prompt}]
-        )
+        async with self._semaphore:
+            response = await asyncio.wait_for(
+                self._client.chat(
+                    model = self.model, 
+                    messages = [{"role": "user", "content": prompt}]
+                ),
+                timeout=self.timeout
+            )
 
         result = response['message']['content']
+        self.last_prompt_tokens = response.get('prompt_eval_count')
         logger.info(f"LLM response length: {len(result)}")
 
         return result 
+
+    async def embed(self, texts: list) -> list:
+        """Embed texts with self.embed_model, under the same concurrency limit as inference"""
+        async with self._semaphore:
+            response = await asyncio.wait_for(
+                self._client.embed(model=self.embed_model, input=texts),
+                timeout=self.timeout
+            )
+        return response['embeddings']
+
+    async def query_until_decision(self, prompt: str):
+        """
+        Stream a completion and stop generating as soon as a complete
+        tool decision object has been emitted
+
+        Returns the decision dict, or None if the stream ended without one.
+        """
+        logger.info(f"Streaming LLM with prompt length : {len(prompt)}")
+
+        async def consume():
+            scanner = JSONObjectScanner()
+            response = []
+            stream = await self._client.chat(
+                model = self.model, 
+                messages = [{"role": "user", "content": prompt}],
+                stream = True
+            )
+            try:
+                async for chunk in stream:
+                    text = chunk['message']['content']
+                    response.append(text)
+                    for candidate in scanner.feed(text):
+                        decision = parse_decision(candidate)
+                        if decision:
+                            return decision
+            finally:
+                # Closing the stream drops the HTTP response, which makes
+                # Ollama abort the rest of the generation
+                await stream.aclose()
+            logger.warning(f"LLM stream ended without a tool decision: {''.join(response)[:200]}")
+            return None
+
+        async with self._semaphore:
+            return await asyncio.wait_for(consume(), timeout=self.timeout)
     
     # def select_tool(self, user_query: str, available_tools: list) -> dict:
     #     """
@@ -57,17 +140,17 @@ class OllamaClient:
         
     #     return {"tool_name": "none", "arguments": {}}
 
-    def select_tool(self, user_query: str, available_tools: list) -> dict:
-        """Use LLM to select appropriate tool based on user query"""
-        
-        # Build detailed tool descriptions with parameters
-        tool_list = []
-        for tool in available_tools:
-            params = tool.inputSchema.get('properties', {})
-            param_str = ", ".join([f"{k}" for k in params.keys()]) if params else "no parameters"
-            tool_list.append(f"- {tool.name} (params: {param_str}): {tool.description}")
+    async def select_tool(self, user_query: str, available_tools) -> dict:
+        """Use LLM to select appropriate tool based on user query
+
+        available_tools is a ToolCatalog or a plain list of MCP tools
+        """
         
-        tools_formatted = "\n".join(tool_list)
+        # Detailed tool descriptions with parameters, precomputed per catalog
+        if isinstance(available_tools, ToolCatalog):
+            tools_formatted = await self._candidate_tools(user_query, available_tools)
+        else:
+            tools_formatted = format_tools(available_tools)
         
         prompt = f"""You are an AI assistant. Select ONE tool from the list below to answer the user query.
 
@@ -81,13 +164,28 @@ class OllamaClient:
 
     Use ONLY tool names from the list above. If unsure, respond: {{"tool_name": "none", "arguments": {{}}}}"""
         
-        response = self.query(prompt)
-        
-        import json
-        import re
-        json_match = re.search(r'\{.*\}', response, re.DOTALL)
-        if json_match:
-            return json.loads(json_match.group())
-        return {"tool_name": "none", "arguments": {}}
+        started = time.perf_counter()
+        if self.stream:
+            decision = await self.query_until_decision(prompt)
+        else:
+            response = await self.query(prompt)
+            decision = extract_decision(response)
+        self.last_decision_ms = (time.perf_counter() - started) * 1000
+        logger.info(f"Tool decision in {self.last_decision_ms:.0f} ms (stream={self.stream})")
+
+        return decision or dict(NO_TOOL)
+
+    async def _candidate_tools(self, user_query: str, catalog: ToolCatalog) -> str:
+        """Formatted list of the top-k most relevant tools, or the whole catalog"""
+        retriever = self._retriever
+        if not 0 < self.top_k < len(catalog):
+            return catalog.tools_formatted
+        try:
+            ranked = await retriever.rank(user_query, catalog, k=self.top_k)
+        except Exception as e:
+            logger.warning(f"Tool prefilter failed, using full catalog: {str(e)}")
+            return catalog.tools_formatted
+        logger.info(f"Prefiltered tools: {[catalog.tools[i].name for i in ranked]}")
+        return "\n".join([catalog.tool_lines[i] for i in ranked])
         
 
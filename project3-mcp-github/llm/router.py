@@ -0,0 +1,226 @@
+import logging
+import re
+import time
+
+from config.settings import ROUTER_MIN_CONFIDENCE
+
+logger = logging.getLogger(__name__)
+
+# Only read-only tools are routed without the LLM; anything that writes to
+# GitHub (create_, update_, push_, fork_ ...) always goes through selection
+ROUTABLE_VERBS = {'search', 'list', 'get'}
+
+VERB_SYNONYMS = {
+    'search': ['search'], 'find': ['search'], 'lookup': ['search'],
+    'list': ['list'], 'show': ['list', 'get'], 'display': ['list', 'get'],
+    'get': ['get'], 'fetch': ['get'], 'read': ['get'], 'open': ['get'],
+}
+
+NOUN_SYNONYMS = {
+    'repos': 'repositories', 'repo': 'repository', 'projects': 'repositories',
+    'project': 'repository', 'prs': 'pulls', 'pr': 'pull', 'files': 'file',
+    'people': 'users', 'person': 'user',
+}
+
+FILLER_WORDS = {'for', 'me', 'my', 'the', 'a', 'an', 'all', 'some', 'please', 'on', 'in', 'of', 'from', 'github',
+                'about', 'with', 'that', 'named', 'called', 'mentioning', 'uses', 'using', 'containing'}
+
+OWNER_REPO_AFTER = re.compile(r'\b(?:from|in|of|for|on)\s+([A-Za-z0-9][\w-]*)/([\w.-]+)')
+OWNER_REPO = re.compile(r'\b([A-Za-z0-9][\w-]*)/([\w.-]+)\b')
+FILE_PATH = re.compile(r'\bfile\s+(\S+)', re.IGNORECASE)
+NUMBER = re.compile(r'#?\b(\d+)\b')
+STATE = re.compile(r'\b(open|closed)\b', re.IGNORECASE)
+WORD = re.compile(r"[\w.#/-]+")
+
+# Confidence factor when the query says more than the arguments capture
+# ("... since 2024", "number of ..."): below ROUTER_MIN_CONFIDENCE, so the
+# LLM decides instead of the rule silently dropping the constraint
+UNCONSUMED_PENALTY = 0.5
+
+
+class RouteDecision:
+    def __init__(self, tool_name: str, arguments: dict, confidence: float, rule: str):
+        self.tool_name = tool_name
+        self.arguments = arguments
+        self.confidence = confidence
+        self.rule = rule
+
+    def as_decision(self) -> dict:
+        return {"tool_name": self.tool_name, "arguments": self.arguments}
+
+    def __repr__(self):
+        return f"RouteDecision({self.tool_name}, {self.arguments}, confidence={self.confidence:.2f}, rule={self.rule})"
+
+
+def _stem(word: str) -> str:
+    word = NOUN_SYNONYMS.get(word, word)
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+class KeywordTable:
+    """Verb and head-noun keywords derived from a tool catalog.
+
+    search_repositories -> verb 'search', head noun 'repositories';
+    get_file_contents -> verb 'get', head noun 'file'.
+    """
+
+    def __init__(self, catalog):
+        self.catalog_hash = catalog.hash
+        self.entries = []
+        for tool in catalog.tools:
+            verb, *nouns = tool.name.split('_')
+            if verb not in ROUTABLE_VERBS or not nouns:
+                continue
+            schema = tool.inputSchema or {}
+            self.entries.append({
+                "tool": tool.name,
+                "verb": verb,
+                "noun": nouns[0],
+                "keywords": set(nouns) | {_stem(n) for n in nouns},
+                "properties": set(schema.get('properties', {})),
+                "required": set(schema.get('required', [])),
+            })
+
+
+class KeywordRule:
+    """Catalog-driven rule: verb + head noun pick the tool, regexes fill the arguments"""
+
+    name = 'keywords'
+
+    def __init__(self):
+        self._table = None
+
+    def _table_for(self, catalog) -> KeywordTable:
+        if self._table is None or self._table.catalog_hash != catalog.hash:
+            self._table = KeywordTable(catalog)
+        return self._table
+
+    def __call__(self, query: str, catalog):
+        tokens = WORD.findall(query)
+        words = [w.lower() for w in tokens]
+        if not words:
+            return None
+        verbs = VERB_SYNONYMS.get(words[0], [])
+        if not verbs:
+            return None
+        stems = {_stem(w) for w in words[1:]}
+
+        scored = []
+        for entry in self._table_for(catalog).entries:
+            if entry['verb'] not in verbs:
+                continue
+            # Exact noun (plural vs singular) beats a stem match, which is
+            # how "show issues" picks list_issues and "show issue 7" get_issue
+            if any(NOUN_SYNONYMS.get(w, w) == entry['noun'] for w in words[1:]):
+                score = 1.0
+            elif _stem(entry['noun']) in stems:
+                score = 0.85
+            else:
+                continue
+            if words[0] != entry['verb']:
+                score *= 0.95
+            extracted = self._extract(query, tokens, entry)
+            if extracted is None:
+                continue
+            arguments, consumed = extracted
+            leftover = [w for w in words[1:]
+                        if w not in consumed and w not in FILLER_WORDS
+                        and w not in entry['keywords'] and _stem(w) not in entry['keywords']]
+            if leftover:
+                logger.debug(f"{entry['tool']}: query terms not captured by arguments: {leftover}")
+                score *= UNCONSUMED_PENALTY
+            scored.append((score, entry['tool'], arguments))
+
+        if not scored:
+            return None
+        scored.sort(key=lambda s: s[0], reverse=True)
+        score, tool_name, arguments = scored[0]
+        if len(scored) > 1 and score - scored[1][0] < 0.1:
+            score *= 0.5
+        return RouteDecision(tool_name, arguments, score, self.name)
+
+    def _extract(self, query: str, tokens: list, entry: dict):
+        """Fill the tool's parameters from the query
+
+        Returns (arguments, lowercased query tokens they were taken from),
+        or None if a required parameter is missing.
+        """
+        properties = entry['properties']
+        arguments = {}
+        consumed = set()
+        path = FILE_PATH.search(query)
+        owner_repo = OWNER_REPO_AFTER.search(query) or OWNER_REPO.search(
+            query if not path else query.replace(path.group(1), ''))
+
+        if 'path' in properties and path:
+            arguments['path'] = path.group(1)
+            consumed |= {'file', path.group(1).lower()}
+        if {'owner', 'repo'} & properties and owner_repo:
+            arguments['owner'], arguments['repo'] = owner_repo.group(1), owner_repo.group(2)
+            consumed.add(f"{owner_repo.group(1)}/{owner_repo.group(2)}".lower())
+        number = NUMBER.search(OWNER_REPO.sub('', query))
+        for name in ('issue_number', 'pull_number', 'pullNumber', 'issueNumber'):
+            if name in properties and number:
+                arguments[name] = int(number.group(1))
+                consumed |= {number.group(1), '#' + number.group(1)}
+        if 'state' in properties:
+            state = STATE.search(query)
+            if state:
+                arguments['state'] = state.group(1).lower()
+                consumed.add(state.group(1).lower())
+        if 'query' in properties or 'q' in properties:
+            skip = FILLER_WORDS | entry['keywords'] | {'open', 'closed'}
+            terms = [t for t in tokens[1:]
+                     if t.lower() not in skip and _stem(t.lower()) not in skip and '/' not in t]
+            if terms:
+                arguments['query' if 'query' in properties else 'q'] = " ".join(terms)
+                consumed |= {t.lower() for t in terms}
+
+        if not entry['required'] <= set(arguments):
+            return None
+        return arguments, consumed
+
+
+class RuleRouter:
+    """Deterministic router tried before LLM tool selection.
+
+    Rules are callables (query, catalog) -> RouteDecision | None, tried in
+    registration order; the first confident match for a tool in the catalog
+    wins. Returns None when no rule is confident enough, so the caller falls
+    back to the LLM.
+    """
+
+    def __init__(self, min_confidence: float = ROUTER_MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.rules = [KeywordRule()]
+        self.last_route_ms = None
+
+    def register(self, rule, first: bool = True):
+        """Add a custom rule, ahead of the built-in ones by default"""
+        if first:
+            self.rules.insert(0, rule)
+        else:
+            self.rules.append(rule)
+
+    def route(self, query: str, catalog):
+        started = time.perf_counter()
+        decision = None
+        for rule in self.rules:
+            candidate = rule(query, catalog)
+            if candidate is None or candidate.tool_name not in catalog.by_name:
+                continue
+            if candidate.confidence >= self.min_confidence:
+                decision = candidate
+                break
+            logger.debug(f"Low-confidence route ignored: {candidate}")
+        self.last_route_ms = (time.perf_counter() - started) * 1000
+        if decision:
+            logger.info(f"Rule router matched in {self.last_route_ms:.2f} ms: {decision}")
+        return decision
+
+
+router = RuleRouter()
@@ -0,0 +1,49 @@
+import logging
+
+import numpy as np
+
+from config.settings import TOOL_PREFILTER_TOP_K
+
+logger = logging.getLogger(__name__)
+
+
+class ToolRetriever:
+    """Narrows a tool catalog to the top-k tools most similar to a query.
+
+    Tool descriptions are embedded once per catalog hash into a row-normalized
+    matrix; each query then costs one embedding call and one matrix-vector
+    product. The matrices are shared by every retriever using the same embed
+    model (llm.embed_model), so each client can have its own top_k.
+    """
+    # embed model -> (catalog hash, matrix); only the current catalog is kept
+    _matrices = {}
+
+    def __init__(self, llm, top_k: int = TOOL_PREFILTER_TOP_K):
+        self.llm = llm
+        self.top_k = top_k
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    async def _matrix(self, catalog) -> np.ndarray:
+        model = self.llm.embed_model
+        cached_hash, matrix = self._matrices.get(model, (None, None))
+        if cached_hash != catalog.hash:
+            texts = [f"{tool.name}: {tool.description}" for tool in catalog.tools]
+            embeddings = await self.llm.embed(texts)
+            matrix = self._normalize(np.asarray(embeddings, dtype=np.float32))
+            # Only the current catalog is ever queried; drop stale matrices
+            ToolRetriever._matrices[model] = (catalog.hash, matrix)
+            logger.info(f"Embedded {len(texts)} tool descriptions ({matrix.shape[1]} dims)")
+        return matrix
+
+    async def rank(self, query: str, catalog, k: int = None) -> list:
+        """Return indices into catalog.tools of the k best matches, best first"""
+        k = min(k or self.top_k, len(catalog))
+        matrix = await self._matrix(catalog)
+        query_vector = self._normalize(np.asarray((await self.llm.embed([query]))[0], dtype=np.float32))
+        scores = matrix @ query_vector
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])].tolist()
@@ -0,0 +1,71 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+NO_TOOL = {"tool_name": "none", "arguments": {}}
+
+
+class JSONObjectScanner:
+    """Finds complete top-level JSON objects in text fed a chunk at a time.
+
+    Tracks brace depth outside of string literals, so the caller learns the
+    moment a streamed object closes without re-scanning the whole response.
+    """
+
+    def __init__(self):
+        self._chars = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text: str) -> list:
+        """Consume a chunk and return the objects it completed, as raw text"""
+        completed = []
+        for ch in text:
+            if self._depth == 0:
+                if ch == '{':
+                    self._depth = 1
+                    self._chars = [ch]
+                continue
+
+            self._chars.append(ch)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == '{':
+                self._depth += 1
+            elif ch == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append("".join(self._chars))
+                    self._chars = []
+        return completed
+
+
+def parse_decision(candidate: str):
+    """Return a {"tool_name", "arguments"} dict parsed from candidate, or None"""
+    try:
+        data = json.loads(candidate)
+    except json.JSONDecodeError:
+        logger.debug(f"Ignoring malformed JSON candidate: {candidate[:80]}")
+        return None
+    if not isinstance(data, dict) or 'tool_name' not in data:
+        return None
+    arguments = data.get('arguments')
+    return {"tool_name": data['tool_name'], "arguments": arguments if isinstance(arguments, dict) else {}}
+
+
+def extract_decision(text: str):
+    """Return the first tool decision found in a complete LLM response, or None"""
+    for candidate in JSONObjectScanner().feed(text):
+        decision = parse_decision(candidate)
+        if decision:
+            return decision
+    return None
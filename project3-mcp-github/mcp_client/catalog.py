@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import time
+
+from config.settings import MCP_CATALOG_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def format_tool(tool) -> str:
+    """Render one tool as a prompt line: name, parameter names and description"""
+    params = tool.inputSchema.get('properties', {})
+    param_str = ", ".join([f"{k}" for k in params.keys()]) if params else "no parameters"
+    return f"- {tool.name} (params: {param_str}): {tool.description}"
+
+
+def format_tools(tools: list) -> str:
+    return "\n".join([format_tool(tool) for tool in tools])
+
+
+class ToolCatalog:
+    """A discovered tool list plus the derived forms built from it"""
+
+    def __init__(self, key: tuple, tools: list):
+        self.key = key
+        self.tools = tools
+        self.by_name = {tool.name: tool for tool in tools}
+        self.tool_lines = [format_tool(tool) for tool in tools]
+        self.tools_formatted = "\n".join(self.tool_lines)
+        self.hash = self._fingerprint(tools)
+        self.created_at = time.monotonic()
+
+    @staticmethod
+    def _fingerprint(tools: list) -> str:
+        payload = [[tool.name, tool.description, tool.inputSchema] for tool in tools]
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def __len__(self):
+        return len(self.tools)
+
+
+class ToolCatalogCache:
+    """Shares tool catalogs across sessions, keyed by (server command, server version)"""
+
+    def __init__(self, ttl: float = MCP_CATALOG_TTL):
+        self.ttl = ttl
+        self._catalogs = {}
+
+    def get(self, key: tuple):
+        """Return the cached catalog for key, or None if missing or expired"""
+        catalog = self._catalogs.get(key)
+        if catalog is None:
+            return None
+        if time.monotonic() - catalog.created_at > self.ttl:
+            logger.info(f"Tool catalog expired: {key}")
+            del self._catalogs[key]
+            return None
+        return catalog
+
+    def put(self, key: tuple, tools: list) -> ToolCatalog:
+        catalog = ToolCatalog(key, tools)
+        self._catalogs[key] = catalog
+        logger.info(f"Cached tool catalog {key} ({len(catalog)} tools, hash {catalog.hash[:12]})")
+        return catalog
+
+    def latest(self, command: str):
+        """Return the newest unexpired catalog for a server command, any version"""
+        candidates = [self.get(key) for key in list(self._catalogs) if key[0] == command]
+        candidates = [c for c in candidates if c is not None]
+        return max(candidates, key=lambda c: c.created_at, default=None)
+
+    def invalidate(self, key: tuple = None):
+        """Drop one catalog, or every catalog when key is None"""
+        if key is None:
+            self._catalogs.clear()
+        else:
+            self._catalogs.pop(key, None)
+        logger.info(f"Tool catalog cache invalidated: {key or 'all'}")
+
+
+catalog_cache = ToolCatalogCache()
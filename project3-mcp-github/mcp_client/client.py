@@ -1,6 +1,8 @@
 import os
 import logging
 from auth.token_store import TokenStore
+from config.settings import MCP_SERVER_COMMAND, MCP_SERVER_ARGS
+from mcp_client.catalog import catalog_cache
 from mcp import ClientSession, StdioServerParameters
 from mcp.client.stdio import stdio_client
 
@@ -11,25 +13,30 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Identifies the server in catalog cache keys
+SERVER_COMMAND_LINE = " ".join([MCP_SERVER_COMMAND] + MCP_SERVER_ARGS)
+
 class MCPClient:
-    def __init__(self, token_store: TokenStore, user_id: str):
+    def __init__(self, token_store: TokenStore, user_id: str, token: str = None):
         self.token_store = token_store
         self.user_id = user_id
+        self.token = token
         self.session = None
+        self.server_info = None
         self._context = None
         logger.info(f"MCPClient initialized for user: {user_id}")
         
     async def __aenter__(self):
         """Async context manager entry"""
-        token = self.token_store.get_token(self.user_id, 'github')
+        token = self.token or self.token_store.get_token(self.user_id, 'github')
         if not token:
             logger.error(f"No GitHub token found for user: {self.user_id}")
             raise ValueError("No GitHub token found")
         
         logger.info("Starting MCP server connection...")
         server_params = StdioServerParameters(
-            command="npx",
-            args=["@modelcontextprotocol/server-github"],
+            command=MCP_SERVER_COMMAND,
+            args=MCP_SERVER_ARGS,
             env={"GITHUB_TOKEN": token}
         )
         
@@ -37,7 +44,8 @@ class MCPClient:
         read, write = await self._context.__aenter__()
         self.session = ClientSession(read, write)
         await self.session.__aenter__()
-        await self.session.initialize()
+        init_result = await self.session.initialize()
+        self.server_info = init_result.serverInfo
         logger.info("MCP server connection established")
         return self
         
@@ -60,6 +68,20 @@ class MCPClient:
         logger.info(f"Discovered {len(tools.tools)} tools")
         return tools
 
+    @property
+    def server_key(self) -> tuple:
+        """Catalog cache key: (server command line, server version)"""
+        version = self.server_info.version if self.server_info else None
+        return (SERVER_COMMAND_LINE, version)
+
+    async def get_catalog(self):
+        """Return the tool catalog for this server, discovering it only on a cache miss"""
+        catalog = catalog_cache.get(self.server_key)
+        if catalog is None:
+            tools = await self.list_tools()
+            catalog = catalog_cache.put(self.server_key, tools.tools)
+        return catalog
+
     async def call_tool(self, tool_name: str, arguments: dict):
         """Call a specific tool with error handling"""
         if not self.session:
@@ -74,4 +96,10 @@ class MCPClient:
             return result
         except Exception as e:
             logger.error(f"Tool call failed: {tool_name} - {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def ping(self):
+        """Check that the MCP server process is still responding"""
+        if not self.session:
+            raise RuntimeError("Client not initialized")
+        await self.session.send_ping()
\ No newline at end of file
@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from auth.token_store import TokenStore, token_store
+from config.settings import (
+    MCP_POOL_MAX_SIZE,
+    MCP_POOL_IDLE_TIMEOUT,
+    MCP_POOL_HEALTH_INTERVAL,
+    MCP_POOL_HEALTH_TIMEOUT,
+)
+from mcp_client.client import MCPClient
+
+logger = logging.getLogger(__name__)
+
+
+class PooledClient:
+    """One warm MCP server process and its initialized session.
+
+    The stdio transport is entered and exited by a dedicated owner task,
+    so the connection can be shared by many requests and closed from any
+    of them.
+    """
+
+    def __init__(self, token_store: TokenStore, user_id: str, token: str):
+        self.token_store = token_store
+        self.user_id = user_id
+        self.token = token
+        self.client = None
+        self.in_use = 0
+        self.retired = False
+        self.last_used = time.monotonic()
+        self.last_checked = time.monotonic()
+        self._ready = asyncio.Event()
+        self._closing = asyncio.Event()
+        self._task = None
+        self._error = None
+
+    async def start(self):
+        """Spawn the MCP server and wait for the session to initialize"""
+        self._task = asyncio.create_task(self._run())
+        try:
+            await self._ready.wait()
+        except asyncio.CancelledError:
+            # The caller gave up mid-spawn: don't leave the server process behind
+            self._task.cancel()
+            await asyncio.shield(asyncio.gather(self._task, return_exceptions=True))
+            raise
+        if self._error:
+            raise self._error
+
+    async def _run(self):
+        try:
+            async with MCPClient(self.token_store, self.user_id, token=self.token) as client:
+                self.client = client
+                self._ready.set()
+                await self._closing.wait()
+        except Exception as e:
+            logger.error(f"MCP server for user {self.user_id} exited: {str(e)}")
+            self._error = e
+        finally:
+            self.client = None
+            self._ready.set()
+
+    @property
+    def alive(self):
+        return self.client is not None and self._task is not None and not self._task.done()
+
+    async def check_health(self, timeout: float) -> bool:
+        """Ping the server, returning False if it is dead or unresponsive"""
+        if not self.alive:
+            return False
+        try:
+            await asyncio.wait_for(self.client.ping(), timeout)
+        except Exception as e:
+            logger.warning(f"MCP health check failed for user {self.user_id}: {str(e)}")
+            return False
+        self.last_checked = time.monotonic()
+        return True
+
+    async def close(self):
+        """Shut down the session and the server process"""
+        self._closing.set()
+        if self._task:
+            await asyncio.gather(self._task, return_exceptions=True)
+
+
+class MCPClientPool:
+    """Keeps initialized MCP sessions alive per (user, token)"""
+
+    def __init__(self, token_store: TokenStore = token_store,
+                 max_size: int = MCP_POOL_MAX_SIZE,
+                 idle_timeout: float = MCP_POOL_IDLE_TIMEOUT,
+                 health_interval: float = MCP_POOL_HEALTH_INTERVAL,
+                 health_timeout: float = MCP_POOL_HEALTH_TIMEOUT):
+        self.token_store = token_store
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self._entries = OrderedDict()
+        self._locks = {}
+        self._closing = set()
+        self._reaper = None
+        token_store.add_listener(self._on_token_changed)
+        logger.info(f"MCPClientPool initialized (max_size={max_size}, idle_timeout={idle_timeout}s)")
+
+    @staticmethod
+    def _key(user_id: str, token: str):
+        return (user_id, hashlib.sha256(token.encode()).hexdigest())
+
+    @asynccontextmanager
+    async def acquire(self, user_id: str):
+        """Borrow a warm MCPClient for user_id, spawning one if needed"""
+        entry = await self.checkout(user_id)
+        try:
+            yield entry.client
+        except Exception:
+            # The failure may be a dead child process; verify before reuse
+            entry.last_checked = 0
+            raise
+        finally:
+            self.release(entry)
+
+    async def checkout(self, user_id: str) -> PooledClient:
+        """Return a healthy pooled entry for user_id and mark it in use"""
+        token = self.token_store.get_token(user_id, 'github')
+        if not token:
+            logger.error(f"No GitHub token found for user: {user_id}")
+            raise ValueError("No GitHub token found")
+
+        self._ensure_reaper()
+        key = self._key(user_id, token)
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if entry is not None and not await self._is_healthy(entry):
+                logger.warning(f"Respawning MCP server for user: {user_id}")
+                self._evict(key)
+                entry = None
+
+            if entry is None:
+                self._retire_user(user_id)
+                self._make_room()
+                entry = PooledClient(self.token_store, user_id, token)
+                started = time.monotonic()
+                await entry.start()
+                logger.info(f"Spawned MCP server for user {user_id} in {time.monotonic() - started:.2f}s")
+                self._entries[key] = entry
+
+            self._entries.move_to_end(key)
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+            return entry
+
+    def release(self, entry: PooledClient):
+        """Return an entry obtained from checkout()"""
+        entry.in_use -= 1
+        entry.last_used = time.monotonic()
+        if entry.retired and entry.in_use == 0:
+            self._schedule_close(entry)
+
+    async def _is_healthy(self, entry: PooledClient) -> bool:
+        if not entry.alive:
+            return False
+        if time.monotonic() - entry.last_checked < self.health_interval:
+            return True
+        return await entry.check_health(self.health_timeout)
+
+    def _make_room(self):
+        """Evict least recently used idle entries until a slot is free"""
+        while len(self._entries) >= self.max_size:
+            idle = next((k for k, e in self._entries.items() if e.in_use == 0), None)
+            if idle is None:
+                logger.warning(f"MCP pool full ({len(self._entries)} busy sessions), growing past max_size")
+                return
+            logger.info(f"Evicting LRU MCP session for user: {idle[0]}")
+            self._evict(idle)
+
+    def _evict(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        entry.retired = True
+        if entry.in_use == 0:
+            self._schedule_close(entry)
+
+    def _retire_user(self, user_id: str):
+        for key in [k for k in self._entries if k[0] == user_id]:
+            self._evict(key)
+
+    def _schedule_close(self, entry: PooledClient):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            logger.warning(f"No event loop to close MCP session for user {entry.user_id}; "
+                           f"its server process is left to exit with the application")
+            return
+        task = loop.create_task(entry.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    def _on_token_changed(self, user_id: str, service: str):
+        """Recycle a user's sessions when their GitHub token is replaced"""
+        if service == 'github':
+            logger.info(f"GitHub token changed, recycling MCP sessions for user: {user_id}")
+            self._retire_user(user_id)
+
+    def _ensure_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        """Background task closing sessions idle longer than idle_timeout"""
+        interval = max(1.0, min(self.idle_timeout, self.health_interval) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for key, entry in list(self._entries.items()):
+                if entry.in_use == 0 and (now - entry.last_used > self.idle_timeout or not entry.alive):
+                    logger.info(f"Closing idle MCP session for user: {key[0]}")
+                    self._evict(key)
+
+    async def close_all(self):
+        """Close every pooled session (called on application shutdown)"""
+        if self._reaper:
+            self._reaper.cancel()
+        for key in list(self._entries):
+            self._entries[key].in_use = 0
+            self._evict(key)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "in_use": sum(1 for e in self._entries.values() if e.in_use),
+        }
+
+
+mcp_pool = MCPClientPool()
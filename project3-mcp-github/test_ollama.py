@@ -1,5 +1,9 @@
+import asyncio
 from llm.ollama_client import OllamaClient
 
-client = OllamaClient()
-response = client.query("What is 2+2?")
-print(f"Response: {response}")
\ No newline at end of file
+async def test():
+    client = OllamaClient()
+    response = await client.query("What is 2+2?")
+    print(f"Response: {response}")
+
+asyncio.run(test())
\ No newline at end of file